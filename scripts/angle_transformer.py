@@ -38,10 +38,10 @@ from core import (
     MULTIANGLE_LORA,
     GGUF_VARIANTS,
     LIGHTNING_LORA,
+    PRESET_NAMES,
     print_status,
 )
-from comfyui_client import ComfyUIClient, load_workflow
-from utils import ensure_output_dir
+from utils import ensure_output_dir, set_quiet, stat_or_none
 
 
 def build_angle_prompt(
@@ -99,6 +99,7 @@ def transform_angle(
     resolution_preset: str = "medium",
     seed: int = 0,
     free_memory: bool = False,
+    gguf_variant: str = "q4_k_m",
 ) -> str:
     """
     Transform a keyframe to a new camera angle using Multi-Angle LoRA.
@@ -118,6 +119,7 @@ def transform_angle(
         resolution_preset: Resolution preset (low, medium, high)
         seed: Random seed (0 for random)
         free_memory: Free GPU memory before generation
+        gguf_variant: GGUF quantization variant or "auto"
 
     Returns:
         Path to saved transformed image
@@ -139,7 +141,7 @@ def transform_angle(
     print_status(f"Angle transformation: {angle_prompt}")
 
     # Initialize generator
-    generator = QwenImageGenerator(resolution_preset=resolution_preset)
+    generator = QwenImageGenerator(gguf_variant=gguf_variant, resolution_preset=resolution_preset)
 
     if not generator.is_available():
         print_status("ComfyUI server not available!", "error")
@@ -151,11 +153,11 @@ def transform_angle(
 
     # For angle transformation, we need to use the multiangle workflow
     # with both Lightning LoRA and Multi-Angle LoRA
-    from core import update_workflow_model, update_workflow_prompts, update_workflow_images
-    from core import update_workflow_resolution, update_workflow_sampler
+    from core import build_slot_values, get_workflow_template
 
     workflow_path = MULTIANGLE_WORKFLOW
-    if not workflow_path.exists():
+    workflow_stat = stat_or_none(workflow_path)
+    if workflow_stat is None:
         print_status(f"Multi-angle workflow not found: {workflow_path}", "error")
         sys.exit(1)
 
@@ -164,55 +166,46 @@ def transform_angle(
     print_status(f"Transform: rotate={rotate_degrees}, tilt={tilt_degrees}, zoom={zoom}")
 
     # Load workflow
-    workflow = load_workflow(str(workflow_path))
+    template = get_workflow_template(workflow_path, workflow_stat.st_mtime_ns)
 
     # Upload input keyframe
-    client = ComfyUIClient()
+    client = generator.client
     print_status("Uploading input keyframe...", "progress")
-    result = client.upload_image(input_image)
+    result = client.upload_image_cached(input_image)
     uploaded_name = result["name"]
     print_status(f"Uploaded: {uploaded_name}")
 
-    # Get resolution from preset
-    from core import RESOLUTION_PRESETS
-    if resolution_preset in RESOLUTION_PRESETS:
-        preset = RESOLUTION_PRESETS[resolution_preset]
-        width = preset["width"]
-        height = preset["height"]
-    else:
-        width = 832
-        height = 480
+    # Resolution from preset (resolved by the generator)
+    width, height = generator.width, generator.height
 
     # Update workflow
-    workflow = update_workflow_model(
-        workflow,
+    workflow = template.apply(build_slot_values(
         generator.model_name,
         generator.lora_name,
-        angle_lora_name=MULTIANGLE_LORA
-    )
-    workflow = update_workflow_prompts(workflow, angle_prompt)
-    workflow = update_workflow_images(workflow, reference=uploaded_name)
-    workflow = update_workflow_resolution(workflow, width, height)
-    workflow = update_workflow_sampler(workflow, seed=seed)
+        angle_prompt,
+        reference=uploaded_name,
+        width=width,
+        height=height,
+        seed=seed,
+        angle_lora_name=MULTIANGLE_LORA,
+    ))
+    client.last_applied.update(unet_name=generator.model_name, lora_name=generator.lora_name)
 
     # Update angle LoRA strength
-    for node_id, node in workflow.items():
-        if not isinstance(node, dict):
-            continue
-        if node.get("_meta", {}).get("title") == "Multi-Angle LoRA":
-            workflow[node_id]["inputs"]["strength_model"] = angle_lora_strength
-            workflow[node_id]["inputs"]["strength_clip"] = angle_lora_strength
+    lora_node_id = template.titles.get("Multi-Angle LoRA")
+    if lora_node_id is not None:
+        inputs = dict(workflow[lora_node_id]["inputs"])
+        inputs["strength_model"] = angle_lora_strength
+        inputs["strength_clip"] = angle_lora_strength
+        workflow[lora_node_id] = {**workflow[lora_node_id], "inputs": inputs}
 
     # Execute workflow
     print_status("Submitting angle transformation request...", "progress")
 
     import time
-    from utils import format_duration
-    start_time = time.time()
-
-    def on_progress(msg):
-        elapsed = time.time() - start_time
-        print_status(f"{msg} ({format_duration(elapsed)})", "progress")
+    from utils import format_duration, make_progress_callback
+    start_ns = time.monotonic_ns()
+    on_progress = make_progress_callback(start_ns)
 
     try:
         result = client.execute_workflow(
@@ -228,9 +221,9 @@ def transform_angle(
             sys.exit(1)
 
         output = ensure_output_dir(output_path)
-        client.download_output(images[0], str(output))
+        client.download_output(images[0], output)
 
-        total_time = time.time() - start_time
+        total_time = (time.monotonic_ns() - start_ns) / 1e9
         print_status(f"Transformed image saved to: {output_path} ({format_duration(total_time)})", "success")
 
         return str(output)
@@ -321,10 +314,16 @@ Examples:
     )
     gen_group.add_argument(
         "--preset",
-        choices=["low", "medium", "high"],
+        choices=PRESET_NAMES,
         default="medium",
         help="Resolution preset (default: medium = 832x480)"
     )
+    gen_group.add_argument(
+        "--gguf",
+        choices=list(GGUF_VARIANTS) + ["auto"],
+        default="q4_k_m",
+        help="GGUF quantization variant, or 'auto' to fit free VRAM (default: q4_k_m)"
+    )
     gen_group.add_argument(
         "--seed",
         type=int,
@@ -336,9 +335,17 @@ Examples:
         action="store_true",
         help="Free GPU memory before generation"
     )
+    gen_group.add_argument(
+        "--quiet", "-q",
+        action="store_true",
+        help="Only print warnings and errors"
+    )
 
     args = parser.parse_args()
 
+    if args.quiet:
+        set_quiet()
+
     # Validate angle ranges
     if not -180 <= args.rotate <= 180:
         print_status("Rotation must be between -180 and 180 degrees", "error")
@@ -358,6 +365,7 @@ Examples:
         resolution_preset=args.preset,
         seed=args.seed,
         free_memory=args.free_memory,
+        gguf_variant=args.gguf,
     )
 
 
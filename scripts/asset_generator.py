@@ -18,11 +18,49 @@ from typing import Optional
 
 from core import (
     QwenImageGenerator,
+    GGUF_VARIANTS,
+    GENERATION_PROFILES,
     T2I_WORKFLOW,
     RESOLUTION_PRESETS,
     print_status,
 )
-from utils import ensure_output_dir
+from utils import set_quiet
+
+
+# =============================================================================
+# Asset Prompts
+# =============================================================================
+
+def character_asset_prompt(description: str, style: str = "anime") -> str:
+    """Prompt for a clean character reference sheet."""
+    return (
+        f"Character design sheet of {description}, "
+        f"full body, neutral A-pose standing straight, arms slightly away from body, "
+        f"facing front, neutral expression, "
+        f"clean white background, flat even studio lighting, "
+        f"character reference sheet, {style} art style, "
+        f"high quality, detailed, no shadows on background"
+    )
+
+
+def background_asset_prompt(description: str, camera_angle: str = "front view", style: str = "anime") -> str:
+    """Prompt for an empty environment reference."""
+    return (
+        f"{description}, "
+        f"establishing shot, {camera_angle}, "
+        f"no people, no characters, empty scene, "
+        f"environment background, {style} art style, "
+        f"high quality, detailed"
+    )
+
+
+def style_asset_prompt(description: str) -> str:
+    """Prompt for a style reference illustration."""
+    return (
+        f"Example scene demonstrating {description} art style, "
+        f"showing characteristic color palette, line work, and shading, "
+        f"high quality illustration, style reference"
+    )
 
 
 # =============================================================================
@@ -59,14 +97,7 @@ def generate_character_asset(
         Path to saved asset
     """
     # Build prompt for clean character reference
-    prompt = (
-        f"Character design sheet of {description}, "
-        f"full body, neutral A-pose standing straight, arms slightly away from body, "
-        f"facing front, neutral expression, "
-        f"clean white background, flat even studio lighting, "
-        f"character reference sheet, {style} art style, "
-        f"high quality, detailed, no shadows on background"
-    )
+    prompt = character_asset_prompt(description, style)
 
     print_status(f"Generating character asset: {name}")
 
@@ -107,13 +138,7 @@ def generate_background_asset(
     Returns:
         Path to saved asset
     """
-    prompt = (
-        f"{description}, "
-        f"establishing shot, {camera_angle}, "
-        f"no people, no characters, empty scene, "
-        f"environment background, {style} art style, "
-        f"high quality, detailed"
-    )
+    prompt = background_asset_prompt(description, camera_angle, style)
 
     print_status(f"Generating background asset: {name}")
 
@@ -151,11 +176,7 @@ def generate_style_asset(
     Returns:
         Path to saved asset
     """
-    prompt = (
-        f"Example scene demonstrating {description} art style, "
-        f"showing characteristic color palette, line work, and shading, "
-        f"high quality illustration, style reference"
-    )
+    prompt = style_asset_prompt(description)
 
     print_status(f"Generating style asset: {name}")
 
@@ -175,6 +196,8 @@ def generate_assets_from_config(
     config_path: str,
     output_dir: str,
     free_memory: bool = False,
+    gguf_variant: str = "q4_k_m",
+    profile: str = "lightning",
 ) -> dict:
     """
     Generate all assets defined in an assets.json configuration file.
@@ -183,6 +206,8 @@ def generate_assets_from_config(
         config_path: Path to assets.json configuration
         output_dir: Base output directory for assets
         free_memory: Free GPU memory before starting
+        gguf_variant: GGUF quantization variant or "auto"
+        profile: Sampler profile name (lightning, full)
 
     Returns:
         Dict mapping asset names to their generated paths
@@ -199,7 +224,7 @@ def generate_assets_from_config(
     results = {}
 
     # Initialize generator
-    generator = QwenImageGenerator()
+    generator = QwenImageGenerator(gguf_variant=gguf_variant, profile=GENERATION_PROFILES[profile])
 
     if not generator.is_available():
         print_status("ComfyUI server not available!", "error")
@@ -208,47 +233,35 @@ def generate_assets_from_config(
     if free_memory:
         generator.free_memory()
 
-    # Generate character assets
+    # Collect all assets, then queue them together so ComfyUI never idles
+    # between images
+    jobs = []
+
     characters = config.get("characters", {})
     for name, char_config in characters.items():
         char_output = output_dir / "characters" / f"{name}.png"
-        ensure_output_dir(str(char_output))
+        prompt = character_asset_prompt(char_config.get("description", name))
+        jobs.append((f"character:{name}", char_output, prompt))
 
-        generate_character_asset(
-            generator=generator,
-            name=name,
-            description=char_config.get("description", name),
-            output_path=str(char_output),
-        )
-        results[f"character:{name}"] = str(char_output)
-
-    # Generate background assets
     backgrounds = config.get("backgrounds", {})
     for name, bg_config in backgrounds.items():
         bg_output = output_dir / "backgrounds" / f"{name}.png"
-        ensure_output_dir(str(bg_output))
-
-        generate_background_asset(
-            generator=generator,
-            name=name,
-            description=bg_config.get("description", name),
-            output_path=str(bg_output),
-        )
-        results[f"background:{name}"] = str(bg_output)
+        prompt = background_asset_prompt(bg_config.get("description", name))
+        jobs.append((f"background:{name}", bg_output, prompt))
 
-    # Generate style assets
     styles = config.get("styles", {})
     for name, style_config in styles.items():
         style_output = output_dir / "styles" / f"{name}.png"
-        ensure_output_dir(str(style_output))
+        prompt = style_asset_prompt(style_config.get("description", name))
+        jobs.append((f"style:{name}", style_output, prompt))
 
-        generate_style_asset(
-            generator=generator,
-            name=name,
-            description=style_config.get("description", name),
-            output_path=str(style_output),
-        )
-        results[f"style:{name}"] = str(style_output)
+    print_status(f"Generating {len(jobs)} assets")
+    generator.generate_batch([
+        {"prompt": prompt, "output_path": str(output), "workflow_path": T2I_WORKFLOW}
+        for _, output, prompt in jobs
+    ])
+    for key, output, _ in jobs:
+        results[key] = str(output)
 
     print_status(f"Generated {len(results)} assets", "success")
     return results
@@ -262,6 +275,7 @@ def main():
     parser = argparse.ArgumentParser(
         description="Generate assets for AI Video Producer keyframe generation"
     )
+    parser.add_argument("--quiet", "-q", action="store_true", help="Only print warnings and errors")
 
     subparsers = parser.add_subparsers(dest="command", help="Asset type to generate")
 
@@ -298,14 +312,31 @@ def main():
     batch_parser.add_argument("--output-dir", "-o", required=True, help="Output directory")
     batch_parser.add_argument("--free-memory", action="store_true", help="Free GPU memory first")
 
+    for sub in (char_parser, bg_parser, style_parser, batch_parser):
+        sub.add_argument(
+            "--gguf",
+            choices=list(GGUF_VARIANTS) + ["auto"],
+            default="q4_k_m",
+            help="GGUF quantization variant, or 'auto' to fit free VRAM (default: q4_k_m)",
+        )
+        sub.add_argument(
+            "--profile",
+            choices=list(GENERATION_PROFILES),
+            default="lightning",
+            help="Sampler profile: lightning (4 steps) or full (20 steps, CFG 4.0)",
+        )
+
     args = parser.parse_args()
 
     if args.command is None:
         parser.print_help()
         sys.exit(1)
 
+    if args.quiet:
+        set_quiet()
+
     if args.command == "character":
-        generator = QwenImageGenerator()
+        generator = QwenImageGenerator(gguf_variant=args.gguf, profile=GENERATION_PROFILES[args.profile])
         if args.free_memory:
             generator.free_memory()
         generate_character_asset(
@@ -318,7 +349,7 @@ def main():
         )
 
     elif args.command == "background":
-        generator = QwenImageGenerator()
+        generator = QwenImageGenerator(gguf_variant=args.gguf, profile=GENERATION_PROFILES[args.profile])
         if args.free_memory:
             generator.free_memory()
         generate_background_asset(
@@ -332,7 +363,7 @@ def main():
         )
 
     elif args.command == "style":
-        generator = QwenImageGenerator()
+        generator = QwenImageGenerator(gguf_variant=args.gguf, profile=GENERATION_PROFILES[args.profile])
         if args.free_memory:
             generator.free_memory()
         generate_style_asset(
@@ -348,6 +379,8 @@ def main():
             config_path=args.config,
             output_dir=args.output_dir,
             free_memory=args.free_memory,
+            gguf_variant=args.gguf,
+            profile=args.profile,
         )
 
 
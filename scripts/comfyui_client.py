@@ -4,9 +4,15 @@ ComfyUI API Client for video generation workflows.
 Handles workflow submission, progress tracking, and output retrieval.
 """
 
+import functools
+import hashlib
 import json
+import mmap
 import os
+import re
+import shutil
 import sys
+import threading
 import time
 import uuid
 from pathlib import Path
@@ -16,12 +22,29 @@ from urllib.parse import urlencode
 try:
     import requests
     import websocket
+    from requests.adapters import HTTPAdapter
 except ImportError as e:
     print(f"Error: Required packages not installed: {e}", file=sys.stderr)
     print("Install with: pip install requests websocket-client", file=sys.stderr)
     sys.exit(1)
 
-from utils import print_status, format_duration
+try:
+    from blake3 import blake3
+    BLAKE3_AVAILABLE = True
+except ImportError:
+    BLAKE3_AVAILABLE = False
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+from utils import StrPath, print_status, format_duration, stat_or_none
+
+
+# Buffer size for streaming downloads to disk
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
 
 class ComfyUIError(Exception):
@@ -58,19 +81,35 @@ class ComfyUIClient:
         self.port = port or int(os.environ.get("COMFYUI_PORT", "8188"))
         self.base_url = f"http://{self.host}:{self.port}"
         self.client_id = str(uuid.uuid4())
+
+        # Pooled keep-alive connections: every status check, upload, queue
+        # and download reuses an open socket instead of a new handshake
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         self._object_info_cache = None
+        # Structural keys (see workflow_shape) of workflows that passed
+        # validate_workflow against the current object_info
+        self._validated_shapes: set[tuple] = set()
+        # (subfolder, content-hashed name) -> name the server stored it under
+        self._known_uploads: dict[tuple[str, str], str] = {}
+        # Model/LoRA/image inputs of the last workflow submitted through this
+        # client. ComfyUI only reloads nodes whose inputs change, so callers
+        # keep these stable to stay on the server's loaded-model cache.
+        self.last_applied: dict[str, Any] = {}
 
     def is_available(self) -> bool:
         """Check if ComfyUI server is running and accessible."""
         try:
-            response = requests.get(f"{self.base_url}/system_stats", timeout=5)
+            response = self.session.get(f"{self.base_url}/system_stats", timeout=5)
             return response.status_code == 200
         except requests.RequestException:
             return False
 
     def get_system_stats(self) -> dict:
         """Get system stats from ComfyUI server."""
-        response = requests.get(f"{self.base_url}/system_stats", timeout=10)
+        response = self.session.get(f"{self.base_url}/system_stats", timeout=10)
         response.raise_for_status()
         return response.json()
 
@@ -85,9 +124,10 @@ class ComfyUIClient:
             Dict mapping node class names to their specifications
         """
         if self._object_info_cache is None or force_refresh:
-            response = requests.get(f"{self.base_url}/object_info", timeout=30)
+            response = self.session.get(f"{self.base_url}/object_info", timeout=30)
             response.raise_for_status()
             self._object_info_cache = response.json()
+            self._validated_shapes.clear()
         return self._object_info_cache
 
     def validate_workflow(self, workflow: dict) -> list[str]:
@@ -159,13 +199,19 @@ class ComfyUIClient:
 
         return errors
 
-    def upload_image(self, image_path: str, subfolder: str = "") -> dict:
+    def upload_image(
+        self,
+        image_path: StrPath,
+        subfolder: str = "",
+        name: str | None = None,
+    ) -> dict:
         """
         Upload an image to ComfyUI for use in workflows.
 
         Args:
             image_path: Path to the image file
             subfolder: Optional subfolder in ComfyUI input directory
+            name: Optional remote filename (default: local filename)
 
         Returns:
             Dict with 'name', 'subfolder', 'type' keys
@@ -176,13 +222,13 @@ class ComfyUIClient:
 
         with open(path, "rb") as f:
             files = {
-                "image": (path.name, f, "image/png"),
+                "image": (name or path.name, f, "image/png"),
             }
             data = {}
             if subfolder:
                 data["subfolder"] = subfolder
 
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/upload/image",
                 files=files,
                 data=data,
@@ -191,32 +237,127 @@ class ComfyUIClient:
             response.raise_for_status()
             return response.json()
 
-    def queue_prompt(self, workflow: dict, validate: bool = True) -> str:
+    def image_exists(
+        self,
+        filename: str,
+        subfolder: str = "",
+        folder_type: str = "input",
+    ) -> bool:
+        """
+        Check whether a file is already present on the ComfyUI server.
+
+        Args:
+            filename: Name of the image file
+            subfolder: Subfolder within the folder type
+            folder_type: 'input', 'output', or 'temp'
+
+        Returns:
+            True if the server has the file, False otherwise
+        """
+        params = {
+            "filename": filename,
+            "subfolder": subfolder,
+            "type": folder_type,
+        }
+        try:
+            response = self.session.head(
+                f"{self.base_url}/view?{urlencode(params)}",
+                timeout=10,
+            )
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def upload_image_cached(
+        self,
+        image_path: StrPath,
+        subfolder: str = "",
+        st: os.stat_result | None = None,
+    ) -> dict:
+        """
+        Upload an image only if the server doesn't already have its contents.
+
+        The remote filename is derived from a content hash, so the same
+        reference image reused across many frames is transferred once.
+
+        Args:
+            image_path: Path to the image file
+            subfolder: Optional subfolder in ComfyUI input directory
+            st: Optional stat result the caller already has for image_path
+
+        Returns:
+            Dict with 'name', 'subfolder', 'type' keys, plus 'reused'
+            (True when no upload was needed)
+        """
+        path = Path(image_path)
+        if st is None:
+            st = stat_or_none(path)
+            if st is None:
+                raise FileNotFoundError(f"Image not found: {image_path}")
+
+        key = file_content_key(str(path.resolve()), st.st_mtime_ns, st.st_size)
+        remote_name = f"{key}{path.suffix.lower()}"
+
+        cache_key = (subfolder, remote_name)
+        known_name = self._known_uploads.get(cache_key)
+        if known_name is None and self.image_exists(remote_name, subfolder):
+            known_name = self._known_uploads[cache_key] = remote_name
+        if known_name is not None:
+            return {"name": known_name, "subfolder": subfolder, "type": "input", "reused": True}
+
+        result = self.upload_image(path, subfolder=subfolder, name=remote_name)
+        # The server may rename on collision; remember what it actually stored
+        self._known_uploads[cache_key] = result.get("name", remote_name)
+        return {**result, "reused": False}
+
+    def queue_prompt(
+        self,
+        workflow: dict | bytes,
+        validate: bool = True,
+        shape: tuple | None = None,
+    ) -> str:
         """
         Submit a workflow for execution.
 
         Args:
-            workflow: ComfyUI workflow dict (API format)
+            workflow: ComfyUI workflow dict (API format), or its JSON
+                encoding as rendered by WorkflowTemplate
             validate: If True, validate workflow before submission
+            shape: workflow_shape() of the workflow, e.g. WorkflowTemplate.shape;
+                saves re-parsing encoded workflows to look up validation
 
         Returns:
             prompt_id for tracking the job
         """
-        # Validate workflow first
-        if validate:
-            errors = self.validate_workflow(workflow)
-            if errors:
-                error_msg = "Workflow validation failed:\n" + "\n".join(f"  - {e}" for e in errors)
-                raise WorkflowValidationError(error_msg)
-
-        payload = {
-            "prompt": workflow,
-            "client_id": self.client_id,
-        }
+        is_encoded = isinstance(workflow, (bytes, bytearray))
 
-        response = requests.post(
+        # Validate workflow first. Validation only looks at node classes and
+        # input names, so each distinct layout is checked once per client.
+        if validate:
+            parsed = None if is_encoded else workflow
+            if shape is None:
+                parsed = parsed or parse_workflow(workflow)
+                shape = workflow_shape(parsed)
+            if shape not in self._validated_shapes:
+                parsed = parsed or parse_workflow(workflow)
+                errors = self.validate_workflow(parsed)
+                if errors:
+                    error_msg = "Workflow validation failed:\n" + "\n".join(f"  - {e}" for e in errors)
+                    raise WorkflowValidationError(error_msg)
+                self._validated_shapes.add(shape)
+
+        if not is_encoded:
+            workflow = dump_workflow(workflow)
+
+        # Splice the serialized workflow into the payload as-is
+        body = b"".join([
+            b'{"prompt": ', workflow,
+            b', "client_id": ', dump_workflow(self.client_id), b"}",
+        ])
+        response = self.session.post(
             f"{self.base_url}/prompt",
-            json=payload,
+            data=body,
+            headers={"Content-Type": "application/json"},
             timeout=30,
         )
 
@@ -273,7 +414,7 @@ class ComfyUIClient:
         Returns:
             Dict with execution history and outputs
         """
-        response = requests.get(
+        response = self.session.get(
             f"{self.base_url}/history/{prompt_id}",
             timeout=30,
         )
@@ -287,7 +428,7 @@ class ComfyUIClient:
         Returns:
             Dict with 'queue_running' and 'queue_pending' lists
         """
-        response = requests.get(
+        response = self.session.get(
             f"{self.base_url}/queue",
             timeout=10,
         )
@@ -309,7 +450,7 @@ class ComfyUIClient:
             Response from the server
         """
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/free",
                 json={"unload_models": unload_models, "free_memory": free_memory},
                 timeout=30,
@@ -328,7 +469,7 @@ class ComfyUIClient:
         Returns:
             Dict with device info, VRAM usage, etc.
         """
-        response = requests.get(
+        response = self.session.get(
             f"{self.base_url}/system_stats",
             timeout=10,
         )
@@ -382,7 +523,7 @@ class ComfyUIClient:
             "type": folder_type,
         }
 
-        response = requests.get(
+        response = self.session.get(
             f"{self.base_url}/view?{urlencode(params)}",
             timeout=60,
         )
@@ -563,19 +704,21 @@ class ComfyUIClient:
 
     def execute_workflow(
         self,
-        workflow: dict,
+        workflow: dict | bytes,
         timeout: int = 600,
         on_progress: Callable | None = None,
         validate: bool = True,
+        shape: tuple | None = None,
     ) -> dict:
         """
         Execute a workflow and wait for completion.
 
         Args:
-            workflow: ComfyUI workflow dict (API format)
+            workflow: ComfyUI workflow dict (API format) or rendered template bytes
             timeout: Maximum time to wait in seconds
             on_progress: Optional callback for progress updates
             validate: If True, validate workflow before submission
+            shape: Precomputed workflow_shape(), see queue_prompt()
 
         Returns:
             Execution result with outputs
@@ -586,7 +729,7 @@ class ComfyUIClient:
                 "Please ensure ComfyUI is running."
             )
 
-        prompt_id = self.queue_prompt(workflow, validate=validate)
+        prompt_id = self.queue_prompt(workflow, validate=validate, shape=shape)
         if on_progress:
             on_progress(f"Job queued: {prompt_id}")
 
@@ -643,7 +786,7 @@ class ComfyUIClient:
     def download_output(
         self,
         output_info: dict,
-        save_path: str,
+        save_path: StrPath,
     ) -> str:
         """
         Download an output file and save it locally.
@@ -655,42 +798,336 @@ class ComfyUIClient:
         Returns:
             Path to saved file
         """
-        content = self.get_image(
-            filename=output_info["filename"],
-            subfolder=output_info.get("subfolder", ""),
-            folder_type=output_info.get("type", "output"),
-        )
+        params = {
+            "filename": output_info["filename"],
+            "subfolder": output_info.get("subfolder", ""),
+            "type": output_info.get("type", "output"),
+        }
 
         save_path = Path(save_path)
         save_path.parent.mkdir(parents=True, exist_ok=True)
 
-        with open(save_path, "wb") as f:
-            f.write(content)
+        # Stream straight to disk in 1 MiB chunks rather than buffering the
+        # whole file (videos can be hundreds of MB)
+        with self.session.get(
+            f"{self.base_url}/view?{urlencode(params)}",
+            timeout=60,
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            with open(save_path, "wb") as f:
+                shutil.copyfileobj(response.raw, f, length=DOWNLOAD_CHUNK_SIZE)
 
         return str(save_path)
 
 
-def load_workflow(workflow_path: str) -> dict:
+_shared_client: ComfyUIClient | None = None
+_shared_client_lock = threading.Lock()
+
+
+def get_client() -> ComfyUIClient:
+    """
+    Return the process-wide ComfyUIClient, creating it on first use.
+
+    Sharing one client keeps its HTTP connection pool, object_info cache,
+    upload cache and last-applied model state across generations.
+    """
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = ComfyUIClient()
+    return _shared_client
+
+
+@functools.lru_cache(maxsize=256)
+def file_content_key(path: str, mtime_ns: int, size: int) -> str:
+    """
+    Compute a short content hash for a file.
+
+    Cached on (path, mtime, size) so unchanged files are only hashed once
+    per process. Uses BLAKE3 when installed, SHA-256 otherwise.
+
+    Args:
+        path: Absolute path to the file
+        mtime_ns: File modification time (part of the cache key)
+        size: File size in bytes (part of the cache key)
+
+    Returns:
+        First 16 hex characters of the digest
+    """
+    hasher = blake3() if BLAKE3_AVAILABLE else hashlib.sha256()
+    if size > 0:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                hasher.update(mm)
+    return hasher.hexdigest()[:16]
+
+
+# Raw workflow file contents: path -> (mtime_ns, bytes)
+_WORKFLOW_CACHE: dict[str, tuple[int, bytes]] = {}
+
+
+def load_workflow(workflow_path: StrPath) -> dict:
     """
     Load a ComfyUI workflow from JSON file.
 
+    The file is read from disk only when its mtime changes; each call still
+    returns a freshly parsed dict that the caller may mutate.
+
     Args:
         workflow_path: Path to workflow JSON file
 
     Returns:
         Workflow dict
     """
-    path = Path(workflow_path)
-    if not path.exists():
+    return parse_workflow(load_workflow_bytes(workflow_path))
+
+
+def load_workflow_bytes(workflow_path: StrPath) -> bytes:
+    """
+    Read a workflow file, cached until its mtime changes.
+
+    Repeated calls for an unchanged file return the same bytes object, so
+    callers can key derived data on its identity.
+
+    Args:
+        workflow_path: Path to workflow JSON file
+
+    Returns:
+        Raw workflow JSON
+    """
+    st = stat_or_none(workflow_path)
+    if st is None:
         raise FileNotFoundError(f"Workflow not found: {workflow_path}")
 
-    with open(path, "r") as f:
-        workflow = json.load(f)
+    key = str(workflow_path)
+    cached = _WORKFLOW_CACHE.get(key)
+    if cached is None or cached[0] != st.st_mtime_ns:
+        with open(workflow_path, "rb") as f:
+            cached = (st.st_mtime_ns, f.read())
+        _WORKFLOW_CACHE[key] = cached
+
+    return cached[1]
+
+
+def parse_workflow(data: bytes | str) -> dict:
+    """
+    Parse workflow JSON, dropping non-node entries like _comment.
 
-    # Filter out non-node entries like _comment
+    Every value in the result is a node dict, so the workflow helpers in
+    this package iterate it without per-node type checks. Uses orjson when
+    installed. Its JSONDecodeError subclasses the stdlib one, so callers
+    catching json.JSONDecodeError work either way.
+
+    Args:
+        data: Workflow JSON text
+
+    Returns:
+        Workflow dict
+    """
+    workflow = orjson.loads(data) if ORJSON_AVAILABLE else json.loads(data)
     return {k: v for k, v in workflow.items() if isinstance(v, dict)}
 
 
+def dump_workflow(value: Any) -> bytes:
+    """
+    Serialize a workflow (or any JSON value) to UTF-8 JSON bytes.
+
+    Uses orjson when installed, falling back to the stdlib for values
+    orjson rejects (e.g. integers wider than 64 bits).
+
+    Args:
+        value: JSON-serializable value
+
+    Returns:
+        Encoded JSON
+    """
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(value)
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(value).encode()
+
+
+class WorkflowTemplate:
+    """
+    A workflow compiled once into pre-serialized JSON with named slots.
+
+    Every input whose value is exactly a "{{NAME}}" placeholder becomes the
+    string slot NAME. Numeric inputs can be exposed as slots too, by naming
+    the node classes and input field that hold them. render() joins the
+    static JSON segments with the encoded slot values, so each submission
+    skips rebuilding and re-serializing the workflow dict. apply() does the
+    same for callers that still need a dict, as direct indexed writes.
+    """
+
+    _SENTINEL = "__AIVP_SLOT_{}__"
+    _SENTINEL_RE = re.compile(rb'"__AIVP_SLOT_(\d+)__"')
+
+    def __init__(
+        self,
+        workflow: dict,
+        numeric_slots: dict[str, tuple[tuple[str, ...], str]] | None = None,
+    ):
+        """
+        Compile a workflow into a template.
+
+        Args:
+            workflow: ComfyUI workflow dict (API format)
+            numeric_slots: Optional mapping of slot name to
+                (node class types, input field), e.g.
+                {"STEPS": (("KSampler",), "steps")}
+        """
+        self.workflow = workflow
+        # Rendering only changes input values, so every render shares this
+        self.shape = workflow_shape(workflow)
+        numeric_slots = numeric_slots or {}
+
+        # One entry per occurrence: (slot name, baked-in value, its encoding)
+        self._occurrences: list[tuple[str, Any, bytes]] = []
+        # Patch plan for apply(): (node_id, field, slot name), same order
+        self._patch_plan: list[tuple[str, str, str]] = []
+        # Node lookup by _meta title
+        self.titles: dict[str, str] = {}
+        marked = {}
+        for node_id, node in workflow.items():
+            inputs = dict(node.get("inputs", {}))
+            class_type = node.get("class_type", "")
+
+            title = node.get("_meta", {}).get("title")
+            if title:
+                self.titles.setdefault(title, node_id)
+
+            for field, value in inputs.items():
+                name = None
+                if isinstance(value, str) and value.startswith("{{") and value.endswith("}}"):
+                    name = value[2:-2]
+                else:
+                    for slot_name, (class_types, slot_field) in numeric_slots.items():
+                        if field == slot_field and class_type in class_types:
+                            name = slot_name
+                            break
+
+                if name is not None:
+                    inputs[field] = self._SENTINEL.format(len(self._occurrences))
+                    self._occurrences.append((name, value, dump_workflow(value)))
+                    self._patch_plan.append((node_id, field, name))
+
+            marked[node_id] = {**node, "inputs": inputs}
+
+        parts = self._SENTINEL_RE.split(dump_workflow(marked))
+        # re.split with a group alternates segment, index, segment, ...
+        self._segments = parts[0::2]
+        self.slots = frozenset(name for name, _, _ in self._occurrences)
+
+    @classmethod
+    def from_file(
+        cls,
+        workflow_path: StrPath,
+        numeric_slots: dict[str, tuple[tuple[str, ...], str]] | None = None,
+    ) -> "WorkflowTemplate":
+        """Load and compile a workflow JSON file."""
+        return cls(load_workflow(workflow_path), numeric_slots)
+
+    def render(self, values: dict[str, Any]) -> bytes:
+        """
+        Render the workflow as JSON bytes ready for queue_prompt.
+
+        Args:
+            values: Slot values keyed by slot name; missing, None, or
+                unchanged values reuse the baked-in encoding
+
+        Returns:
+            Encoded workflow
+        """
+        segments = self._segments
+        parts = [segments[0]]
+        for (name, baked, encoded), segment in zip(self._occurrences, segments[1:]):
+            value = values.get(name)
+            if value is None or value == baked:
+                parts.append(encoded)
+            else:
+                parts.append(dump_workflow(value))
+            parts.append(segment)
+        return b"".join(parts)
+
+    def apply(self, values: dict[str, Any]) -> dict:
+        """
+        Build a workflow dict with slot values filled in.
+
+        Walks the precomputed patch plan instead of scanning every node, and
+        copies only the input dicts it writes to.
+
+        Args:
+            values: Slot values keyed by slot name; missing or None values
+                keep the workflow's baked-in value
+
+        Returns:
+            New workflow dict (the template is not modified)
+        """
+        workflow = dict(self.workflow)
+        copied_inputs = {}
+        for node_id, field, name in self._patch_plan:
+            value = values.get(name)
+            if value is None:
+                continue
+            inputs = copied_inputs.get(node_id)
+            if inputs is None:
+                node = workflow[node_id]
+                inputs = copied_inputs[node_id] = dict(node["inputs"])
+                workflow[node_id] = {**node, "inputs": inputs}
+            inputs[field] = value
+        return workflow
+
+
+def index_nodes(workflow: dict) -> list[tuple[str, str, str, dict]]:
+    """
+    Flatten a workflow into (node_id, class_type, lowercase title, inputs).
+
+    Resolving the nested .get() chains and lowercasing titles once lets
+    update passes iterate plain tuples. The inputs entry is the node's own
+    dict (created if missing), so writes through it modify the workflow.
+
+    Args:
+        workflow: Workflow dict as returned by parse_workflow
+
+    Returns:
+        One tuple per node, in workflow order
+    """
+    return [
+        (
+            node_id,
+            node.get("class_type", ""),
+            node.get("_meta", {}).get("title", "").lower(),
+            node.setdefault("inputs", {}),
+        )
+        for node_id, node in workflow.items()
+    ]
+
+
+def workflow_shape(workflow: dict) -> tuple:
+    """
+    Structural key of a workflow: node IDs, class types and input names.
+
+    Two workflows with the same shape get the same validate_workflow
+    result, whatever their input values.
+
+    Args:
+        workflow: ComfyUI workflow dict
+
+    Returns:
+        Hashable key
+    """
+    return tuple(
+        (node_id, node.get("class_type"), tuple(node.get("inputs", ())))
+        for node_id, node in workflow.items()
+        if isinstance(node, dict)
+    )
+
+
 def update_workflow_value(
     workflow: dict,
     node_id: str,
@@ -709,13 +1146,11 @@ def update_workflow_value(
     Returns:
         Modified workflow dict
     """
-    if node_id not in workflow:
+    node = workflow.get(node_id)
+    if node is None:
         raise KeyError(f"Node {node_id} not found in workflow")
 
-    if "inputs" not in workflow[node_id]:
-        workflow[node_id]["inputs"] = {}
-
-    workflow[node_id]["inputs"][field] = value
+    node.setdefault("inputs", {})[field] = value
     return workflow
 
 
@@ -724,15 +1159,13 @@ def find_node_by_title(workflow: dict, title: str) -> str | None:
     Find a node ID by its title (from _meta).
 
     Args:
-        workflow: Workflow dict
+        workflow: Workflow dict as returned by parse_workflow
         title: Title to search for
 
     Returns:
         Node ID or None if not found
     """
     for node_id, node_data in workflow.items():
-        if not isinstance(node_data, dict):
-            continue
         meta = node_data.get("_meta", {})
         if meta.get("title", "").lower() == title.lower():
             return node_id
@@ -744,15 +1177,13 @@ def find_node_by_class(workflow: dict, class_type: str) -> str | None:
     Find first node ID by class type.
 
     Args:
-        workflow: Workflow dict
+        workflow: Workflow dict as returned by parse_workflow
         class_type: Class type to search for
 
     Returns:
         Node ID or None if not found
     """
     for node_id, node_data in workflow.items():
-        if not isinstance(node_data, dict):
-            continue
         if node_data.get("class_type") == class_type:
             return node_id
     return None
@@ -7,17 +7,28 @@ This module preserves all existing GGUF, LoRA, and memory management logic
 from qwen_image_comfyui.py while providing a cleaner API for new scripts.
 """
 
+import argparse
+import hashlib
 import json
+import multiprocessing
+import os
+import pickle
 import sys
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from enum import IntEnum
 from pathlib import Path
 from typing import Optional, Callable, Any
 
 from comfyui_client import (
-    ComfyUIClient,
     ComfyUIError,
+    WorkflowTemplate,
     WorkflowValidationError,
-    load_workflow,
+    get_client,
+    parse_workflow,
 )
 from utils import (
     load_style_config,
@@ -25,6 +36,9 @@ from utils import (
     print_status,
     format_duration,
     build_enhanced_prompt,
+    StrPath,
+    make_progress_callback,
+    stat_or_none,
 )
 
 
@@ -44,14 +58,40 @@ GGUF_VARIANTS = {
     "q8_0": "qwen-image-edit-2511-Q8_0.gguf",      # ~22GB - highest quality
 }
 
+# Approximate VRAM footprint of each GGUF variant in GB, largest first
+GGUF_VARIANT_SIZES_GB = [
+    (22, "q8_0"),
+    (17, "q6_k"),
+    (15, "q5_k_m"),
+    (13, "q4_k_m"),
+    (10, "q3_k_m"),
+    (7, "q2_k"),
+]
+
 # Lightning LoRA for fast 4-step generation
 LIGHTNING_LORA = "Qwen-Image-Edit-2511-Lightning-4steps-V1.0-bf16.safetensors"
 
 # Resolution presets
+class Preset(IntEnum):
+    """Resolution presets; values index PRESET_SIZES."""
+    LOW = 0
+    MEDIUM = 1
+    HIGH = 2
+
+
+# (width, height) per Preset
+PRESET_SIZES: tuple[tuple[int, int], ...] = (
+    (640, 384),
+    (832, 480),
+    (1280, 720),
+)
+
+# CLI choices, lowercase preset names
+PRESET_NAMES = [preset.name.lower() for preset in Preset]
+
 RESOLUTION_PRESETS = {
-    "low": {"width": 640, "height": 384},
-    "medium": {"width": 832, "height": 480},
-    "high": {"width": 1280, "height": 720},
+    name: {"width": width, "height": height}
+    for name, (width, height) in zip(PRESET_NAMES, PRESET_SIZES)
 }
 
 # Default negative prompt
@@ -61,188 +101,221 @@ DEFAULT_NEGATIVE = "bad quality, worst quality, blurry, distorted, deformed, ugl
 T2I_WORKFLOW = WORKFLOW_DIR / "qwen_t2i.json"
 REFERENCE_WORKFLOW = WORKFLOW_DIR / "qwen_reference.json"
 MULTIANGLE_WORKFLOW = WORKFLOW_DIR / "qwen_multiangle.json"
+# Qwen workflow files, as opposed to the WAN ones sharing WORKFLOW_DIR
+QWEN_WORKFLOW_GLOB = "qwen_*.json"
 
 # Multi-Angle LoRA for camera control
 MULTIANGLE_LORA = "Qwen-Edit-MultiAngle.safetensors"
 
 
-# =============================================================================
-# Workflow Update Functions (preserved from qwen_image_comfyui.py)
-# =============================================================================
+@dataclass(frozen=True)
+class GenerationProfile:
+    """Sampler settings that are only valid together.
 
-def update_workflow_model(
-    workflow: dict,
-    model_name: str,
-    lora_name: str,
-    angle_lora_name: str = None
-) -> dict:
-    """Update model and LoRA names in workflow.
-
-    Args:
-        workflow: Workflow dictionary
-        model_name: GGUF model filename
-        lora_name: Lightning LoRA filename
-        angle_lora_name: Optional Multi-Angle LoRA filename
+    Lightning needs few steps at CFG 1.0; without it the model needs more
+    steps and real guidance. Mixing the two wastes GPU time on bad images.
     """
-    for node_id, node in workflow.items():
-        if not isinstance(node, dict):
-            continue
-
-        inputs = node.get("inputs", {})
-
-        # Update GGUF model name
-        if "unet_name" in inputs and "{{MODEL_NAME}}" in str(inputs.get("unet_name", "")):
-            workflow[node_id]["inputs"]["unet_name"] = model_name
-        elif inputs.get("unet_name") == "{{MODEL_NAME}}":
-            workflow[node_id]["inputs"]["unet_name"] = model_name
+    steps: int
+    cfg: float
+    shift: float
+    use_lightning: bool
 
-        # Update LoRA name
-        if "lora_name" in inputs and "{{LORA_NAME}}" in str(inputs.get("lora_name", "")):
-            workflow[node_id]["inputs"]["lora_name"] = lora_name
-        elif inputs.get("lora_name") == "{{LORA_NAME}}":
-            workflow[node_id]["inputs"]["lora_name"] = lora_name
 
-        # Update Angle LoRA name
-        if angle_lora_name:
-            if "lora_name" in inputs and "{{ANGLE_LORA}}" in str(inputs.get("lora_name", "")):
-                workflow[node_id]["inputs"]["lora_name"] = angle_lora_name
-            elif inputs.get("lora_name") == "{{ANGLE_LORA}}":
-                workflow[node_id]["inputs"]["lora_name"] = angle_lora_name
+LIGHTNING_4STEP = GenerationProfile(steps=4, cfg=1.0, shift=5.0, use_lightning=True)
+FULL_20STEP = GenerationProfile(steps=20, cfg=4.0, shift=3.1, use_lightning=False)
 
-    return workflow
+GENERATION_PROFILES = {
+    "lightning": LIGHTNING_4STEP,
+    "full": FULL_20STEP,
+}
 
+# Node classes carrying output width/height
+RESOLUTION_CLASSES = frozenset({"EmptyQwenImageLayeredLatentImage", "EmptySD3LatentImage", "ImageScale"})
+
+# Numeric inputs exposed as template slots: name -> (node classes, input field)
+QWEN_NUMERIC_SLOTS = {
+    "WIDTH": (RESOLUTION_CLASSES, "width"),
+    "HEIGHT": (RESOLUTION_CLASSES, "height"),
+    "STEPS": (("KSampler",), "steps"),
+    "CFG": (("KSampler",), "cfg"),
+    "SEED": (("KSampler",), "seed"),
+    "SHIFT": (("ModelSamplingAuraFlow",), "shift"),
+}
 
-def update_workflow_prompts(
-    workflow: dict,
-    prompt: str,
-    negative_prompt: str = None
-) -> dict:
-    """Update text prompts in workflow."""
-    if negative_prompt is None:
-        negative_prompt = DEFAULT_NEGATIVE
+# Compiled workflow templates: path -> (mtime_ns, template)
+_TEMPLATE_CACHE: dict[str, tuple[int, WorkflowTemplate]] = {}
 
-    for node_id, node in workflow.items():
-        if not isinstance(node, dict):
-            continue
+# On-disk cache of compiled templates, keyed by workflow content hash
+TEMPLATE_CACHE_DIR = Path.home() / ".cache" / "qwen_image_comfyui"
+# Part of the cache key; bump whenever WorkflowTemplate's stored attributes
+# or their encoding change, so stale pickles are recompiled instead of
+# failing later in render()/apply()
+TEMPLATE_CACHE_VERSION = 3
 
-        inputs = node.get("inputs", {})
 
-        # Update positive prompt
-        if inputs.get("prompt") == "{{PROMPT}}":
-            workflow[node_id]["inputs"]["prompt"] = prompt
+def compile_workflow_template(workflow_path: StrPath) -> WorkflowTemplate:
+    """Compile a workflow, reusing a pickled template for identical content.
 
-        # Update negative prompt
-        if inputs.get("text") == "{{NEGATIVE_PROMPT}}":
-            workflow[node_id]["inputs"]["text"] = negative_prompt
+    Args:
+        workflow_path: Path to workflow JSON file
 
-    return workflow
+    Returns:
+        Compiled WorkflowTemplate
+    """
+    data = Path(workflow_path).read_bytes()
+    # Sorted so the key doesn't depend on frozenset iteration order
+    slots_key = repr(sorted((name, sorted(classes), field) for name, (classes, field) in QWEN_NUMERIC_SLOTS.items()))
+    digest = hashlib.sha256(f"v{TEMPLATE_CACHE_VERSION}:{slots_key}".encode() + data).hexdigest()
+    cache_path = TEMPLATE_CACHE_DIR / f"{digest}.pkl"
 
+    try:
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass  # Missing, stale or corrupt entry - compile and overwrite
 
-def update_workflow_images(
-    workflow: dict,
-    reference: str = None,
-    reference2: str = None,
-    reference3: str = None,
-) -> dict:
-    """Update image inputs in workflow.
+    template = WorkflowTemplate(parse_workflow(data), QWEN_NUMERIC_SLOTS)
 
-    Supports up to 3 reference images for multi-character scenes:
-    - reference: image1 slot (background or character 1)
-    - reference2: image2 slot (character 1 or 2)
-    - reference3: image3 slot (character 2 or 3)
+    try:
+        TEMPLATE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(template, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # Cache is best-effort
 
-    When reference2/reference3 are not provided, falls back to the primary reference
-    to satisfy workflow requirements (ComfyUI LoadImage nodes require valid images).
-    """
-    # Use primary reference as fallback for missing references
-    ref2_final = reference2 if reference2 else reference
-    ref3_final = reference3 if reference3 else reference
+    return template
 
-    for node_id, node in workflow.items():
-        if not isinstance(node, dict):
-            continue
 
-        inputs = node.get("inputs", {})
+def warm_template_cache(workflow_dir: Path, jobs: int = None) -> int:
+    """Compile every Qwen workflow under a directory into the on-disk cache.
 
-        if node.get("class_type") == "LoadImage":
-            current_image = str(inputs.get("image", ""))
+    Only qwen_*.json files are compiled; the WAN workflows are patched by
+    wan_video_comfyui's own compiled patcher and never use these templates.
 
-            # Reference image 1 (primary)
-            if current_image == "{{REFERENCE}}":
-                if reference:
-                    workflow[node_id]["inputs"]["image"] = reference
+    Args:
+        workflow_dir: Directory to search recursively for qwen_*.json
+        jobs: Worker processes (default: CPU count)
 
-            # Reference image 2 (with fallback)
-            elif current_image == "{{REFERENCE2}}":
-                if ref2_final:
-                    workflow[node_id]["inputs"]["image"] = ref2_final
+    Returns:
+        Number of workflows compiled
+    """
+    paths = sorted(Path(workflow_dir).rglob(QWEN_WORKFLOW_GLOB))
+    if not paths:
+        return 0
+
+    # spawn keeps workers independent of the parent's open sockets/threads
+    ctx = multiprocessing.get_context("spawn")
+    compiled = 0
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx) as pool:
+        for path, error in zip(paths, pool.map(_warm_one, paths)):
+            if error:
+                print_status(f"Skipped {path.name}: {error}", "warning")
+            else:
+                compiled += 1
+    return compiled
+
+
+def _warm_one(workflow_path: Path) -> str | None:
+    """Worker for warm_template_cache; returns an error message or None."""
+    try:
+        compile_workflow_template(workflow_path)
+        return None
+    except (OSError, ValueError) as e:
+        return str(e)
+
+
+def get_workflow_template(workflow_path: StrPath, mtime_ns: int) -> WorkflowTemplate:
+    """Load and compile a workflow, recompiling only when the file changes.
 
-            # Reference image 3 (with fallback)
-            elif current_image == "{{REFERENCE3}}":
-                if ref3_final:
-                    workflow[node_id]["inputs"]["image"] = ref3_final
+    Args:
+        workflow_path: Path to workflow JSON file
+        mtime_ns: Modification time from the caller's stat of workflow_path
+    """
+    key = str(workflow_path)
+    cached = _TEMPLATE_CACHE.get(key)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
 
-    return workflow
+    template = compile_workflow_template(workflow_path)
+    _TEMPLATE_CACHE[key] = (mtime_ns, template)
+    return template
 
 
-def update_workflow_resolution(
-    workflow: dict,
+def build_slot_values(
+    model_name: str,
+    lora_name: str,
+    prompt: str,
+    negative_prompt: str = None,
+    reference: str = None,
+    reference2: str = None,
+    reference3: str = None,
     width: int = None,
     height: int = None,
+    steps: int = None,
+    cfg: float = None,
+    seed: int = None,
+    shift: float = None,
+    angle_lora_name: str = None,
 ) -> dict:
-    """Update resolution parameters in workflow."""
-    resolution_nodes = [
-        "EmptyQwenImageLayeredLatentImage",
-        "EmptySD3LatentImage",
-        "ImageScale",
-    ]
+    """Collect every Qwen workflow parameter into one template slot mapping.
 
-    for node_id, node in workflow.items():
-        if not isinstance(node, dict):
-            continue
+    Every Qwen workflow parameter is filled in through these slots, in a
+    single pass by WorkflowTemplate.render() or apply(). Missing references
+    fall back to the primary one, as LoadImage nodes require a valid image,
+    and a seed <= 0 keeps the workflow's own.
+    """
+    return {
+        "MODEL_NAME": model_name,
+        "LORA_NAME": lora_name,
+        "ANGLE_LORA": angle_lora_name,
+        "PROMPT": prompt,
+        "NEGATIVE_PROMPT": negative_prompt if negative_prompt is not None else DEFAULT_NEGATIVE,
+        "REFERENCE": reference,
+        "REFERENCE2": reference2 or reference,
+        "REFERENCE3": reference3 or reference,
+        "WIDTH": width,
+        "HEIGHT": height,
+        "STEPS": steps,
+        "CFG": cfg,
+        "SEED": seed if seed is not None and seed > 0 else None,
+        "SHIFT": shift,
+    }
 
-        class_type = node.get("class_type", "")
-        inputs = node.get("inputs", {})
 
-        if class_type in resolution_nodes:
-            if width is not None and "width" in inputs:
-                workflow[node_id]["inputs"]["width"] = width
-            if height is not None and "height" in inputs:
-                workflow[node_id]["inputs"]["height"] = height
+# =============================================================================
+# GGUF Variant Selection
+# =============================================================================
 
-    return workflow
+def pick_gguf_variant(free_gb: float, installed: set[str] | None = None) -> str:
+    """Pick the largest GGUF variant that fits in free VRAM.
 
+    Offloading a variant that doesn't fit is far slower than running a
+    smaller quantization entirely on the GPU, so leave ~15% headroom for
+    activations and the text encoder.
 
-def update_workflow_sampler(
-    workflow: dict,
-    steps: int = None,
-    cfg: float = None,
-    seed: int = None,
-    shift: float = None,
-) -> dict:
-    """Update sampler and flow matching parameters in workflow."""
-    for node_id, node in workflow.items():
-        if not isinstance(node, dict):
-            continue
-
-        class_type = node.get("class_type", "")
-        inputs = node.get("inputs", {})
+    Args:
+        free_gb: Free VRAM in GB
+        installed: Optional set of GGUF filenames present on the server;
+            variants not in it are skipped
 
-        # Update KSampler
-        if class_type == "KSampler":
-            if steps is not None:
-                workflow[node_id]["inputs"]["steps"] = steps
-            if cfg is not None:
-                workflow[node_id]["inputs"]["cfg"] = cfg
-            if seed is not None and seed > 0:
-                workflow[node_id]["inputs"]["seed"] = seed
+    Returns:
+        GGUF variant key (e.g. "q4_k_m")
+    """
+    candidates = [
+        (size, variant) for size, variant in GGUF_VARIANT_SIZES_GB
+        if installed is None or GGUF_VARIANTS[variant] in installed
+    ]
+    if not candidates:
+        return "q4_k_m"
 
-        # Update ModelSamplingAuraFlow (shift parameter)
-        if class_type == "ModelSamplingAuraFlow":
-            if shift is not None:
-                workflow[node_id]["inputs"]["shift"] = shift
+    for size, variant in candidates:
+        if size * 1.15 < free_gb:
+            return variant
 
-    return workflow
+    # Nothing fits - the smallest available variant offloads the least
+    return candidates[-1][1]
 
 
 # =============================================================================
@@ -260,61 +333,159 @@ class QwenImageGenerator:
         gguf_variant: str = "q4_k_m",
         use_lightning: bool = True,
         resolution_preset: str = "medium",
+        profile: GenerationProfile | None = None,
     ):
         """
         Initialize generator.
 
         Args:
             gguf_variant: GGUF quantization variant (q2_k, q3_k_m, q4_k_m, q5_k_m, q6_k, q8_0)
+                or "auto" to pick the largest variant fitting in free VRAM
             use_lightning: Use Lightning LoRA for fast 4-step generation
+                (ignored when profile is given)
             resolution_preset: Resolution preset (low, medium, high)
+            profile: Sampler profile; defaults to LIGHTNING_4STEP or
+                FULL_20STEP depending on use_lightning
         """
-        self.client = ComfyUIClient()
+        if profile is None:
+            profile = LIGHTNING_4STEP if use_lightning else FULL_20STEP
+
+        self.client = get_client()
         self.gguf_variant = gguf_variant
-        self.use_lightning = use_lightning
+        self.profile = profile
+        self.use_lightning = profile.use_lightning
         self.resolution_preset = resolution_preset
 
+        if gguf_variant == "auto":
+            self.gguf_variant = self._auto_gguf_variant()
+
         # Validate GGUF variant
-        if gguf_variant not in GGUF_VARIANTS:
+        elif gguf_variant not in GGUF_VARIANTS:
             print_status(f"Unknown GGUF variant: {gguf_variant}, using q4_k_m", "warning")
             self.gguf_variant = "q4_k_m"
 
         # Get model names
         self.model_name = GGUF_VARIANTS[self.gguf_variant]
-        self.lora_name = LIGHTNING_LORA if use_lightning else ""
+        self.lora_name = LIGHTNING_LORA if self.use_lightning else ""
 
         # Get resolution
-        if resolution_preset in RESOLUTION_PRESETS:
-            preset = RESOLUTION_PRESETS[resolution_preset]
-            self.width = preset["width"]
-            self.height = preset["height"]
-        else:
-            self.width = 832
-            self.height = 480
+        try:
+            self.width, self.height = PRESET_SIZES[Preset[resolution_preset.upper()]]
+        except (KeyError, AttributeError):
+            print_status(f"Unknown resolution preset: {resolution_preset}, using medium", "warning")
+            self.width, self.height = PRESET_SIZES[Preset.MEDIUM]
 
     def is_available(self) -> bool:
         """Check if ComfyUI server is available."""
         return self.client.is_available()
 
+    def _auto_gguf_variant(self) -> str:
+        """Choose a GGUF variant from the server's free VRAM and installed models."""
+        # A model this client already ran is still loaded; its VRAM shows as
+        # used, so re-measuring would pick a smaller variant and force a reload
+        loaded = self.client.last_applied.get("unet_name")
+        for variant, filename in GGUF_VARIANTS.items():
+            if filename == loaded:
+                print_status(f"Keeping loaded GGUF variant {variant}")
+                return variant
+
+        try:
+            devices = self.client.get_system_stats().get("devices", [])
+        except Exception as e:
+            print_status(f"Could not query VRAM ({e}), using q4_k_m", "warning")
+            return "q4_k_m"
+
+        if not devices:
+            print_status("No GPU reported by ComfyUI, using q4_k_m", "warning")
+            return "q4_k_m"
+
+        free_gb = devices[0].get("vram_free", 0) / (1024**3)
+
+        installed = None
+        try:
+            loader = self.client.get_object_info().get("UnetLoaderGGUF", {})
+            options = loader.get("input", {}).get("required", {}).get("unet_name", [[]])[0]
+            if isinstance(options, list):
+                installed = set(options)
+        except Exception:
+            pass  # Fall back to choosing by VRAM alone
+
+        variant = pick_gguf_variant(free_gb, installed)
+        print_status(f"Auto-selected GGUF variant {variant} ({free_gb:.1f}GB VRAM free)")
+        return variant
+
     def free_memory(self) -> None:
         """Free GPU memory (useful when switching from WAN video)."""
         print_status("Freeing GPU memory before generation...", "*")
         self.client.free_memory()
 
+    def preload_models(self, workflow_path: Path = T2I_WORKFLOW, timeout: int = 600) -> bool:
+        """
+        Load the GGUF model, text encoder and LoRA into ComfyUI ahead of use.
+
+        ComfyUI loads models lazily on the first job, so the first real
+        keyframe pays the full load time. This runs a throwaway 1-step
+        64x64 generation with the same model inputs to warm the server.
+
+        Args:
+            workflow_path: Text-to-image workflow to run (no references needed)
+            timeout: Maximum wait in seconds
+
+        Returns:
+            True if the warm-up job completed
+        """
+        workflow_stat = stat_or_none(workflow_path)
+        if workflow_stat is None:
+            print_status(f"Workflow not found: {workflow_path}", "error")
+            return False
+
+        template = get_workflow_template(workflow_path, workflow_stat.st_mtime_ns)
+        workflow = template.render(build_slot_values(
+            self.model_name,
+            self.lora_name,
+            "x",
+            width=64,
+            height=64,
+            steps=1,
+            seed=1,
+        ))
+        self.client.last_applied.update(unet_name=self.model_name, lora_name=self.lora_name)
+
+        print_status(f"Preloading {self.model_name}...", "progress")
+        start_ns = time.monotonic_ns()
+        try:
+            self.client.execute_workflow(
+                workflow,
+                timeout=timeout,
+                on_progress=make_progress_callback(start_ns),
+                validate=True,
+                shape=template.shape,
+            )
+        except (ComfyUIError, TimeoutError, ConnectionError) as e:
+            print_status(f"Preload failed: {e}", "warning")
+            return False
+
+        elapsed = (time.monotonic_ns() - start_ns) / 1e9
+        print_status(f"Models loaded ({format_duration(elapsed)})", "success")
+        return True
+
     def _upload_image(self, image_path: str, description: str) -> str:
         """Upload image to ComfyUI and return uploaded name."""
-        if not Path(image_path).exists():
+        st = stat_or_none(image_path)
+        if st is None:
             raise FileNotFoundError(f"{description} not found: {image_path}")
 
-        result = self.client.upload_image(image_path)
+        result = self.client.upload_image_cached(image_path, st=st)
         uploaded_name = result["name"]
-        print_status(f"Uploaded {description}: {uploaded_name}")
+        if result.get("reused"):
+            print_status(f"Reusing uploaded {description}: {uploaded_name}")
+        else:
+            print_status(f"Uploaded {description}: {uploaded_name}")
         return uploaded_name
 
-    def generate(
+    def _prepare_workflow(
         self,
         prompt: str,
-        output_path: str,
         workflow_path: Path,
         reference_image: str = None,
         reference_image2: str = None,
@@ -322,43 +493,24 @@ class QwenImageGenerator:
         width: int = None,
         height: int = None,
         seed: int = 0,
-        steps: int = 4,
-        cfg: float = 1.0,
-        shift: float = 5.0,
+        steps: int = None,
+        cfg: float = None,
+        shift: float = None,
         style_config: dict = None,
-        timeout: int = 300,  # 5 min default (no ControlNet = faster generation)
-        free_memory: bool = False,
-    ) -> str:
+    ) -> tuple[bytes, tuple]:
         """
-        Generate an image using specified workflow.
-
-        Args:
-            prompt: Text prompt describing the image
-            output_path: Path to save generated image
-            workflow_path: Path to workflow JSON file
-            reference_image: Reference image 1 (background or character 1)
-            reference_image2: Reference image 2 (character 1 or 2)
-            reference_image3: Reference image 3 (character 2 or 3)
-            width: Image width (or use preset)
-            height: Image height (or use preset)
-            seed: Random seed (0 for random)
-            steps: Sampling steps (default 4 with Lightning)
-            cfg: Guidance scale (default 1.0 with Lightning)
-            shift: Flow matching shift (default 5.0)
-            style_config: Optional style configuration dict
-            timeout: Maximum wait time in seconds
-            free_memory: Free GPU memory before generation
+        Upload references and render the workflow; see generate() for args.
 
         Returns:
-            Path to saved image
+            Tuple of (encoded workflow, its template's shape)
         """
-        if not self.is_available():
-            print_status("ComfyUI server not available!", "error")
-            print_status("Please start ComfyUI: python scripts/setup_comfyui.py --start", "error")
-            sys.exit(1)
-
-        if free_memory:
-            self.free_memory()
+        # Fill unset sampler values from the profile
+        if steps is None:
+            steps = self.profile.steps
+        if cfg is None:
+            cfg = self.profile.cfg
+        if shift is None:
+            shift = self.profile.shift
 
         # Use preset resolution if not specified
         if width is None:
@@ -371,12 +523,13 @@ class QwenImageGenerator:
         print_status(f"Prompt: {enhanced_prompt[:100]}...")
 
         # Load workflow
-        if not workflow_path.exists():
+        workflow_stat = stat_or_none(workflow_path)
+        if workflow_stat is None:
             print_status(f"Workflow not found: {workflow_path}", "error")
             sys.exit(1)
 
         try:
-            workflow = load_workflow(str(workflow_path))
+            template = get_workflow_template(workflow_path, workflow_stat.st_mtime_ns)
         except json.JSONDecodeError as e:
             print_status(f"Invalid workflow JSON: {e}", "error")
             sys.exit(1)
@@ -398,62 +551,274 @@ class QwenImageGenerator:
             print_status("Uploading reference image 3 to ComfyUI...", "progress")
             ref_image_name3 = self._upload_image(reference_image3, "reference3")
 
-        # Update workflow with all parameters
-        workflow = update_workflow_model(workflow, self.model_name, self.lora_name)
-        workflow = update_workflow_prompts(workflow, enhanced_prompt)
-        workflow = update_workflow_images(workflow, ref_image_name, ref_image_name2, ref_image_name3)
-        workflow = update_workflow_resolution(workflow, width, height)
-        workflow = update_workflow_sampler(workflow, steps, cfg, seed, shift)
+        # Changing the model input makes ComfyUI unload and re-dequantize it
+        last = self.client.last_applied
+        if last.get("unet_name") not in (None, self.model_name):
+            print_status(f"Switching model {last['unet_name']} -> {self.model_name} (server will reload)", "warning")
+
+        # Render workflow with all parameters
+        workflow = template.render(build_slot_values(
+            self.model_name,
+            self.lora_name,
+            enhanced_prompt,
+            reference=ref_image_name,
+            reference2=ref_image_name2,
+            reference3=ref_image_name3,
+            width=width,
+            height=height,
+            steps=steps,
+            cfg=cfg,
+            seed=seed,
+            shift=shift,
+        ))
+        last.update(
+            unet_name=self.model_name,
+            lora_name=self.lora_name,
+            images=(ref_image_name, ref_image_name2, ref_image_name3),
+        )
 
-        # Execute workflow
-        print_status("Submitting image generation request...", "progress")
         print_status(f"Model: {self.model_name}")
         if self.use_lightning:
-            print_status("Using Lightning LoRA (4-step fast mode)")
+            print_status(f"Using Lightning LoRA ({steps}-step fast mode)")
         print_status(f"Settings: {width}x{height}, {steps} steps, CFG {cfg}, Shift {shift}")
 
-        start_time = time.time()
+        return workflow, template.shape
 
-        def on_progress(msg):
-            elapsed = time.time() - start_time
-            print_status(f"{msg} ({format_duration(elapsed)})", "progress")
+    def _save_first_image(self, result: dict, output_path: str) -> str:
+        """Download the first output image of a finished job."""
+        images = self.client.get_output_images(result)
 
+        if not images:
+            print_status("No image generated!", "error")
+            sys.exit(1)
+
+        output = ensure_output_dir(output_path)
+        self.client.download_output(images[0], output)
+        return str(output)
+
+    @contextmanager
+    def _exit_on_error(self, timeout: int):
+        """Report generation failures and exit, as the CLIs expect."""
         try:
+            yield
+        except WorkflowValidationError as e:
+            print_status("Workflow validation failed:", "error")
+            print(str(e))
+            sys.exit(1)
+        except ComfyUIError as e:
+            print_status("ComfyUI error:", "error")
+            print(str(e))
+            sys.exit(1)
+        except TimeoutError:
+            print_status(f"Generation timed out after {timeout}s", "error")
+            sys.exit(1)
+        except Exception as e:
+            print_status(f"Generation failed: {e}", "error")
+            sys.exit(1)
+
+    def generate(
+        self,
+        prompt: str,
+        output_path: str,
+        workflow_path: Path,
+        reference_image: str = None,
+        reference_image2: str = None,
+        reference_image3: str = None,
+        width: int = None,
+        height: int = None,
+        seed: int = 0,
+        steps: int = None,
+        cfg: float = None,
+        shift: float = None,
+        style_config: dict = None,
+        timeout: int = 300,  # 5 min default (no ControlNet = faster generation)
+        free_memory: bool = False,
+    ) -> str:
+        """
+        Generate an image using specified workflow.
+
+        Args:
+            prompt: Text prompt describing the image
+            output_path: Path to save generated image
+            workflow_path: Path to workflow JSON file
+            reference_image: Reference image 1 (background or character 1)
+            reference_image2: Reference image 2 (character 1 or 2)
+            reference_image3: Reference image 3 (character 2 or 3)
+            width: Image width (or use preset)
+            height: Image height (or use preset)
+            seed: Random seed (0 for random)
+            steps: Sampling steps (default from profile)
+            cfg: Guidance scale (default from profile)
+            shift: Flow matching shift (default from profile)
+            style_config: Optional style configuration dict
+            timeout: Maximum wait time in seconds
+            free_memory: Free GPU memory before generation
+
+        Returns:
+            Path to saved image
+        """
+        if not self.is_available():
+            print_status("ComfyUI server not available!", "error")
+            print_status("Please start ComfyUI: python scripts/setup_comfyui.py --start", "error")
+            sys.exit(1)
+
+        if free_memory:
+            self.free_memory()
+
+        workflow, shape = self._prepare_workflow(
+            prompt,
+            workflow_path,
+            reference_image=reference_image,
+            reference_image2=reference_image2,
+            reference_image3=reference_image3,
+            width=width,
+            height=height,
+            seed=seed,
+            steps=steps,
+            cfg=cfg,
+            shift=shift,
+            style_config=style_config,
+        )
+
+        # Execute workflow
+        print_status("Submitting image generation request...", "progress")
+
+        start_ns = time.monotonic_ns()
+        on_progress = make_progress_callback(start_ns)
+
+        with self._exit_on_error(timeout):
             result = self.client.execute_workflow(
                 workflow,
                 timeout=timeout,
                 on_progress=on_progress,
                 validate=True,
+                shape=shape,
             )
 
-            # Get output images
-            images = self.client.get_output_images(result)
+            output = self._save_first_image(result, output_path)
 
-            if not images:
-                print_status("No image generated!", "error")
-                sys.exit(1)
+            total_time = (time.monotonic_ns() - start_ns) / 1e9
+            print_status(f"Image saved to: {output_path} ({format_duration(total_time)})", "success")
 
-            # Download and save the first image
-            output = ensure_output_dir(output_path)
-            image_info = images[0]
-            self.client.download_output(image_info, str(output))
+            return output
 
-            total_time = time.time() - start_time
-            print_status(f"Image saved to: {output_path} ({format_duration(total_time)})", "success")
+    def generate_batch(
+        self,
+        jobs: list[dict],
+        timeout: int = 300,
+        max_queued: int = 2,
+    ) -> list[str]:
+        """
+        Generate several images, keeping ComfyUI's queue fed.
 
-            return str(output)
+        The next jobs are uploaded, rendered and queued while the current
+        one runs on the GPU, and each finished image is downloaded while
+        the next is already sampling, hiding per-image round trips.
 
-        except WorkflowValidationError as e:
-            print_status("Workflow validation failed:", "error")
-            print(str(e))
+        Args:
+            jobs: List of generate() keyword dicts; each needs prompt,
+                output_path and workflow_path. A job's own timeout
+                overrides the batch one, and free_memory frees GPU memory
+                before that job is queued
+            timeout: Default maximum wait per image in seconds
+            max_queued: Maximum jobs submitted ahead of completion
+
+        Returns:
+            Paths to saved images, in job order
+        """
+        if not self.is_available():
+            print_status("ComfyUI server not available!", "error")
+            print_status("Please start ComfyUI: python scripts/setup_comfyui.py --start", "error")
             sys.exit(1)
-        except ComfyUIError as e:
-            print_status("ComfyUI error:", "error")
-            print(str(e))
+
+        outputs = []
+        pending = deque()  # (prompt_id, output_path, timeout, start_ns)
+
+        def collect():
+            prompt_id, output_path, job_timeout, job_start_ns = pending.popleft()
+            result = self.client.wait_for_completion(
+                prompt_id,
+                timeout=job_timeout,
+                on_progress=make_progress_callback(job_start_ns),
+            )
+            outputs.append(self._save_first_image(result, output_path))
+            total_time = (time.monotonic_ns() - job_start_ns) / 1e9
+            print_status(
+                f"[{len(outputs)}/{len(jobs)}] Image saved to: {output_path} ({format_duration(total_time)})",
+                "success",
+            )
+
+        with self._exit_on_error(timeout):
+            for index, job in enumerate(jobs, 1):
+                job = dict(job)
+                output_path = job.pop("output_path")
+                job_timeout = job.pop("timeout", timeout)
+                if job.pop("free_memory", False):
+                    self.free_memory()
+                workflow, shape = self._prepare_workflow(**job)
+                prompt_id = self.client.queue_prompt(workflow, validate=True, shape=shape)
+                pending.append((prompt_id, output_path, job_timeout, time.monotonic_ns()))
+                print_status(f"[{index}/{len(jobs)}] Queued: {prompt_id}", "progress")
+
+                if len(pending) >= max_queued:
+                    collect()
+
+            while pending:
+                collect()
+
+        return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Warm caches ahead of a production run"
+    )
+    parser.add_argument(
+        "--warm-cache",
+        metavar="DIR",
+        help="Precompile the Qwen workflows (qwen_*.json) under DIR into the on-disk template cache"
+    )
+    parser.add_argument(
+        "--jobs", "-j",
+        type=int,
+        default=None,
+        help="Worker processes for --warm-cache (default: CPU count)"
+    )
+    parser.add_argument(
+        "--preload",
+        action="store_true",
+        help="Load the image model into ComfyUI with a tiny throwaway generation"
+    )
+    parser.add_argument(
+        "--gguf",
+        choices=list(GGUF_VARIANTS) + ["auto"],
+        default="q4_k_m",
+        help="GGUF variant to preload (default: q4_k_m)"
+    )
+    args = parser.parse_args()
+
+    if not args.warm_cache and not args.preload:
+        parser.error("nothing to do: pass --warm-cache DIR and/or --preload")
+
+    if args.warm_cache:
+        if not Path(args.warm_cache).is_dir():
+            print_status(f"Directory not found: {args.warm_cache}", "error")
             sys.exit(1)
-        except TimeoutError:
-            print_status(f"Generation timed out after {timeout}s", "error")
+
+        start_ns = time.monotonic_ns()
+        count = warm_template_cache(Path(args.warm_cache), args.jobs)
+        elapsed = (time.monotonic_ns() - start_ns) / 1e9
+        print_status(f"Compiled {count} workflow(s) into {TEMPLATE_CACHE_DIR} ({format_duration(elapsed)})", "success")
+
+    if args.preload:
+        generator = QwenImageGenerator(gguf_variant=args.gguf)
+        if not generator.is_available():
+            print_status("ComfyUI server not available!", "error")
+            print_status("Please start ComfyUI: python scripts/setup_comfyui.py --start", "error")
             sys.exit(1)
-        except Exception as e:
-            print_status(f"Generation failed: {e}", "error")
+        if not generator.preload_models():
             sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -36,11 +36,14 @@ from typing import List, Optional
 
 from core import (
     QwenImageGenerator,
+    GGUF_VARIANTS,
+    GENERATION_PROFILES,
+    PRESET_NAMES,
     REFERENCE_WORKFLOW,
     RESOLUTION_PRESETS,
     print_status,
 )
-from utils import ensure_output_dir, load_style_config
+from utils import ensure_output_dir, load_style_config, set_quiet
 
 
 def generate_keyframe(
@@ -52,6 +55,8 @@ def generate_keyframe(
     resolution_preset: str = "medium",
     seed: int = 0,
     free_memory: bool = False,
+    gguf_variant: str = "q4_k_m",
+    profile: str = "lightning",
 ) -> str:
     """
     Generate a keyframe using character reference images.
@@ -69,6 +74,8 @@ def generate_keyframe(
         resolution_preset: Resolution preset (low, medium, high)
         seed: Random seed (0 for random)
         free_memory: Free GPU memory before generation
+        gguf_variant: GGUF quantization variant or "auto"
+        profile: Sampler profile name (lightning, full)
 
     Returns:
         Path to saved keyframe
@@ -102,7 +109,11 @@ def generate_keyframe(
             print_status(f"Style config not found: {style}", "warning")
 
     # Initialize generator
-    generator = QwenImageGenerator(resolution_preset=resolution_preset)
+    generator = QwenImageGenerator(
+        gguf_variant=gguf_variant,
+        resolution_preset=resolution_preset,
+        profile=GENERATION_PROFILES[profile],
+    )
 
     if not generator.is_available():
         print_status("ComfyUI server not available!", "error")
@@ -232,10 +243,22 @@ Examples:
     gen_group = parser.add_argument_group("Generation Settings")
     gen_group.add_argument(
         "--preset",
-        choices=["low", "medium", "high"],
+        choices=PRESET_NAMES,
         default="medium",
         help="Resolution preset (default: medium = 832x480)"
     )
+    gen_group.add_argument(
+        "--gguf",
+        choices=list(GGUF_VARIANTS) + ["auto"],
+        default="q4_k_m",
+        help="GGUF quantization variant, or 'auto' to fit free VRAM (default: q4_k_m)"
+    )
+    gen_group.add_argument(
+        "--profile",
+        choices=list(GENERATION_PROFILES),
+        default="lightning",
+        help="Sampler profile: lightning (4 steps) or full (20 steps, CFG 4.0)"
+    )
     gen_group.add_argument(
         "--seed",
         type=int,
@@ -247,9 +270,17 @@ Examples:
         action="store_true",
         help="Free GPU memory before generation (use when switching from video)"
     )
+    gen_group.add_argument(
+        "--quiet", "-q",
+        action="store_true",
+        help="Only print warnings and errors"
+    )
 
     args = parser.parse_args()
 
+    if args.quiet:
+        set_quiet()
+
     generate_keyframe(
         prompt=args.prompt,
         output_path=args.output,
@@ -259,6 +290,8 @@ Examples:
         resolution_preset=args.preset,
         seed=args.seed,
         free_memory=args.free_memory,
+        gguf_variant=args.gguf,
+        profile=args.profile,
     )
 
 
@@ -10,20 +10,84 @@ Usage:
     python setup_comfyui.py --check      # Check if setup is complete
     python setup_comfyui.py --start      # Start ComfyUI server
     python setup_comfyui.py --models     # Download models only
+
+Set AIVP_CACHE_DIR to keep the pip/uv wheel cache, the HuggingFace cache
+and downloaded models under one directory that CI can persist between runs.
 """
 
 import argparse
+import errno
+import filecmp
+import functools
+import hashlib
+import importlib
+import json
 import os
+import shutil
+import socket
 import subprocess
 import sys
+import threading
+import urllib.parse
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Callable
+
+# Root for every persistent cache, e.g. a CI cache volume (opt-in)
+CACHE_ROOT = Path(os.environ["AIVP_CACHE_DIR"]) if os.environ.get("AIVP_CACHE_DIR") else None
+if CACHE_ROOT:
+    # Must be set before huggingface_hub is imported
+    os.environ.setdefault("HF_HOME", str(CACHE_ROOT / "huggingface"))
+
+HF_AVAILABLE = False
+HF_TRANSFER_AVAILABLE = False
+HF_CACHE_DIR = None
+hf_hub_download = None
+
+
+def load_hf_hub() -> bool:
+    """
+    Import huggingface_hub, enabling the hf_transfer Rust backend if present.
+
+    huggingface_hub reads HF_HUB_ENABLE_HF_TRANSFER at import time, so the
+    flag is set first. Safe to call again after setup pip-installs them:
+    if the hub was imported before hf_transfer arrived, its constant is
+    switched on directly.
+
+    Returns:
+        True if huggingface_hub is available
+    """
+    global HF_AVAILABLE, HF_TRANSFER_AVAILABLE, HF_CACHE_DIR, hf_hub_download
+
+    importlib.invalidate_caches()
+    try:
+        import hf_transfer  # noqa: F401
+        hf_transfer_installed = True
+        os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+    except ImportError:
+        hf_transfer_installed = False
+
+    try:
+        from huggingface_hub import constants, hf_hub_download
+        HF_AVAILABLE = True
+        # Honours HF_HOME / HF_HUB_CACHE; older releases use the long name
+        HF_CACHE_DIR = Path(getattr(constants, "HF_HUB_CACHE", None) or constants.HUGGINGFACE_HUB_CACHE)
+        # An explicit HF_HUB_ENABLE_HF_TRANSFER=0 from the user is respected
+        enabled = os.environ.get("HF_HUB_ENABLE_HF_TRANSFER", "").upper() in {"1", "ON", "YES", "TRUE"}
+        if hf_transfer_installed and enabled:
+            constants.HF_HUB_ENABLE_HF_TRANSFER = True
+        # Route by what the hub will actually use, not by what is installed
+        HF_TRANSFER_AVAILABLE = bool(getattr(constants, "HF_HUB_ENABLE_HF_TRANSFER", False))
+    except ImportError:
+        HF_AVAILABLE = False
+        HF_TRANSFER_AVAILABLE = False
 
-try:
-    from huggingface_hub import hf_hub_download
-    HF_AVAILABLE = True
-except ImportError:
-    HF_AVAILABLE = False
+    return HF_AVAILABLE
+
+
+load_hf_hub()
 
 
 # Configuration - ComfyUI installs in repository folder
@@ -33,6 +97,10 @@ COMFYUI_DIR = PROJECT_DIR / "comfyui"
 
 COMFYUI_REPO = "https://github.com/comfyanonymous/ComfyUI.git"
 
+# PyTorch CUDA build, installed on its own ahead of the rest in install_dependencies
+TORCH_INDEX_URL = "https://download.pytorch.org/whl/cu124"
+TORCH_PACKAGES = ["torch", "torchvision", "torchaudio"]
+
 # Additional pip packages required for custom nodes
 ADDITIONAL_PIP_PACKAGES = [
     "matplotlib",
@@ -54,8 +122,33 @@ CUSTOM_NODES = {
     "comfyui_controlnet_aux": "https://github.com/Fannovel16/comfyui_controlnet_aux.git",
     "ComfyUI-WanMoeKSampler": "https://github.com/stduhpf/ComfyUI-WanMoeKSampler.git",  # MoE sampler for WAN 2.2
 }
-
-# Model URLs and paths (relative to ComfyUI/models/)
+# Concurrent submodule fetches per repository
+GIT_JOBS = 8
+
+# Parallel HTTP range connections per file (like aria2c -s 8 -x 8)
+DOWNLOAD_CONNECTIONS = max(1, int(os.environ.get("AIVP_DL_CONNECTIONS", "8")))
+# Socket read / file write size; large reads keep the copy loop's syscall
+# and interpreter overhead negligible next to the network
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+# Unit of parallelism and of resume: an interrupted download loses at most
+# the pieces in flight
+DOWNLOAD_PIECE_SIZE = 64 * 1024 * 1024
+# Extra attempts for a piece whose transfer breaks off partway
+PIECE_RETRIES = 3
+# Files downloaded at the same time
+MAX_PARALLEL_DOWNLOADS = max(1, int(os.environ.get("AIVP_MAX_PARALLEL_DOWNLOADS", "4")))
+# Content-addressed download cache shared across workspaces/CI jobs (opt-in)
+if os.environ.get("AIVP_MODEL_CACHE_DIR"):
+    MODEL_CACHE_DIR = Path(os.environ["AIVP_MODEL_CACHE_DIR"])
+else:
+    MODEL_CACHE_DIR = CACHE_ROOT / "models" if CACHE_ROOT else None
+# Other ComfyUI models/ directories to take existing files from (os.pathsep-separated)
+SIBLING_MODEL_DIRS = [Path(p) for p in os.environ.get("AIVP_SIBLING_MODEL_DIRS", "").split(os.pathsep) if p]
+
+# Model URLs and paths (relative to ComfyUI/models/). URL entries may add
+# "sha256" to have the download verified before it is moved into place.
+# Entries may also give the exact "bytes"; otherwise the rounded size_gb is
+# used as a plausibility floor (see model_file_ok).
 MODELS = {
     # WAN 2.1 GGUF model (Q4_K_M for 10GB VRAM - 11.3GB file)
     "diffusion_models/wan2.1-i2v-14b-480p-Q4_K_M.gguf": {
@@ -87,6 +180,7 @@ MODELS = {
         "url": "https://huggingface.co/unsloth/Qwen-Image-Edit-2511-GGUF/resolve/main/qwen-image-edit-2511-Q4_K_M.gguf",
         "size_gb": 13.1,
         "required": True,
+        "gguf_variant": "q4_k_m",  # Others are added below; pick with --gguf
     },
     # Qwen VL Text Encoder (FP8)
     "text_encoders/qwen_2.5_vl_7b_fp8_scaled.safetensors": {
@@ -139,46 +233,144 @@ MODELS = {
     },
 }
 
-
-def print_status(message: str, status: str = "info"):
-    """Print a status message with color."""
-    colors = {
-        "info": "\033[94m",
-        "success": "\033[92m",
-        "warning": "\033[93m",
-        "error": "\033[91m",
-        "progress": "\033[96m",
+# Other Qwen Image Edit quantizations from the same repo (GGUF_VARIANTS in
+# core.py picks whichever is installed); approximate sizes in GB
+DEFAULT_QWEN_GGUF = "q4_k_m"
+for _variant, _size_gb in {
+    "q2_k": 7.1, "q3_k_m": 9.7, "q5_k_m": 15.0, "q6_k": 16.8, "q8_0": 21.8,
+}.items():
+    _file = f"qwen-image-edit-2511-{_variant.upper()}.gguf"
+    MODELS[f"diffusion_models/{_file}"] = {
+        "url": f"https://huggingface.co/unsloth/Qwen-Image-Edit-2511-GGUF/resolve/main/{_file}",
+        "size_gb": _size_gb,
+        "required": False,  # Optional - use --gguf to download instead of Q4_K_M
+        "gguf_variant": _variant,
     }
-    icons = {
-        "info": "[i]",
-        "success": "[+]",
-        "warning": "[!]",
-        "error": "[x]",
-        "progress": "[*]",
+
+# Derived once at import instead of re-filtering MODELS at each use
+for _path, _info in MODELS.items():
+    _info["name"] = Path(_path).name
+REQUIRED_MODELS = {path: info for path, info in MODELS.items() if info.get("required", False)}
+Q6K_MODELS = {path: info for path, info in MODELS.items() if info.get("q6k")}
+QWEN_GGUF_MODELS = {info["gguf_variant"]: path for path, info in MODELS.items() if "gguf_variant" in info}
+
+
+def required_models(gguf: str = DEFAULT_QWEN_GGUF) -> dict[str, dict]:
+    """REQUIRED_MODELS with the Qwen Image Edit GGUF swapped for the given variant."""
+    if gguf == DEFAULT_QWEN_GGUF:
+        return REQUIRED_MODELS
+    default_path, path = QWEN_GGUF_MODELS[DEFAULT_QWEN_GGUF], QWEN_GGUF_MODELS[gguf]
+    return {
+        (path if p == default_path else p): (MODELS[path] if p == default_path else info)
+        for p, info in REQUIRED_MODELS.items()
     }
-    reset = "\033[0m"
-    color = colors.get(status, "")
-    icon = icons.get(status, "")
-    print(f"{color}{icon} {message}{reset}")
 
 
-def run_command(cmd: list, cwd: Path = None, check: bool = True) -> subprocess.CompletedProcess:
-    """Run a command and return the result."""
+# Clones and downloads report from worker threads; print() writes the text
+# and the newline separately, so lines could otherwise interleave
+_PRINT_LOCK = threading.Lock()
+
+
+# Prefixes built once; ANSI colors only on a terminal so CI logs stay plain
+_COLOR = sys.stdout.isatty()
+_STATUS_PREFIX = {
+    status: f"{color if _COLOR else ''}{icon} "
+    for status, (color, icon) in {
+        "info": ("\033[94m", "[i]"),
+        "success": ("\033[92m", "[+]"),
+        "warning": ("\033[93m", "[!]"),
+        "error": ("\033[91m", "[x]"),
+        "progress": ("\033[96m", "[*]"),
+    }.items()
+}
+_STATUS_SUFFIX = "\033[0m\n" if _COLOR else "\n"
+
+
+def print_status(message: str, status: str = "info"):
+    """Print a status message with color."""
+    line = f"{_STATUS_PREFIX.get(status, ' ')}{message}{_STATUS_SUFFIX}"
+    with _PRINT_LOCK:
+        sys.stdout.write(line)
+        # Flushed so it lands in order with streamed git/pip output
+        sys.stdout.flush()
+
+
+def run_command(
+    cmd: list,
+    cwd: Path = None,
+    check: bool = True,
+    stream: bool = False,
+) -> subprocess.CompletedProcess:
+    """
+    Run a command and return the result.
+
+    Args:
+        cmd: Command and arguments
+        cwd: Working directory
+        check: Raise CalledProcessError on a non-zero exit
+        stream: Pass output straight through to the terminal instead of
+            capturing it, so long installs show live progress and their
+            logs aren't held in memory (result.stdout/stderr are None)
+    """
     try:
         result = subprocess.run(
             cmd,
             cwd=cwd,
-            capture_output=True,
+            capture_output=not stream,
             text=True,
             check=check,
         )
         return result
     except subprocess.CalledProcessError as e:
         print_status(f"Command failed: {' '.join(cmd)}", "error")
-        print_status(f"Error: {e.stderr}", "error")
+        if e.stderr:
+            print_status(f"Error: {e.stderr}", "error")
         raise
 
 
+def find_uv() -> list[str] | None:
+    """
+    Locate the uv installer, on PATH or as the pip-installed "uv" package.
+
+    Returns:
+        Command prefix to run uv, or None if it is not installed
+    """
+    uv = shutil.which("uv")
+    if uv:
+        return [uv]
+
+    importlib.invalidate_caches()
+    try:
+        import uv as uv_package
+        return [uv_package.find_uv_bin()]
+    except (ImportError, FileNotFoundError):
+        return None
+
+
+def pip_install_cmd() -> list[str]:
+    """
+    Base "pip install" command shared by every install step.
+
+    Uses "uv pip install" when uv is available: it resolves and downloads
+    wheels in parallel with a persistent metadata cache, typically several
+    times faster than pip.
+
+    With plain pip, prefers wheels so cached binaries are reused instead of
+    rebuilding from source. Both caches are persistent by default; set
+    AIVP_PIP_CACHE_DIR (or AIVP_CACHE_DIR) to pin it elsewhere.
+    """
+    uv = find_uv()
+    if uv:
+        os.environ.setdefault("UV_CONCURRENT_DOWNLOADS", "16")
+        cmd = [*uv, "pip", "install", "--python", sys.executable]
+    else:
+        cmd = [sys.executable, "-m", "pip", "install", "--prefer-binary", "--no-input", "--disable-pip-version-check"]
+    cache_dir = os.environ.get("AIVP_PIP_CACHE_DIR") or (str(CACHE_ROOT / "pip") if CACHE_ROOT else None)
+    if cache_dir:
+        cmd += ["--cache-dir", cache_dir]
+    return cmd
+
+
 def check_python():
     """Check Python version."""
     version = sys.version_info
@@ -202,113 +394,656 @@ def check_git():
     return False
 
 
+@functools.lru_cache(maxsize=1)
+def query_gpu() -> tuple[str, float] | None:
+    """
+    Name and VRAM of the first CUDA GPU.
+
+    Asks nvidia-smi first, which answers in milliseconds; importing torch
+    loads hundreds of MB of libraries and creates a CUDA context, so it is
+    only used when nvidia-smi is not on PATH or its answer can't be parsed
+    (memory.total reads "[N/A]" on some vGPU and WSL setups).
+
+    Returns:
+        (device name, VRAM in GB), or None if no CUDA GPU is available
+
+    Raises:
+        ImportError: If neither nvidia-smi nor PyTorch is available
+    """
+    if shutil.which("nvidia-smi"):
+        result = run_command(
+            ["nvidia-smi", "--query-gpu=name,memory.total", "--format=csv,noheader,nounits"],
+            check=False,
+        )
+        if result.returncode != 0 or not result.stdout.strip():
+            return None
+        try:
+            name, memory_mib = result.stdout.splitlines()[0].rsplit(",", 1)
+            return name.strip(), float(memory_mib) / 1024
+        except ValueError:
+            pass
+
+    import torch
+    if not torch.cuda.is_available():
+        return None
+    return torch.cuda.get_device_name(0), torch.cuda.get_device_properties(0).total_memory / (1024**3)
+
+
 def check_cuda():
     """Check for CUDA availability."""
     try:
-        import torch
-        if torch.cuda.is_available():
-            device_name = torch.cuda.get_device_name(0)
-            vram = torch.cuda.get_device_properties(0).total_memory / (1024**3)
-            print_status(f"CUDA: {device_name} ({vram:.1f}GB VRAM)", "success")
-            if vram < 10:
-                print_status(f"Warning: 10GB+ VRAM recommended for WAN 2.2 Q4_K_M", "warning")
-            return True
-        else:
-            print_status("CUDA not available", "warning")
-            return False
+        gpu = query_gpu()
     except ImportError:
         print_status("PyTorch not installed yet", "info")
         return None
+    if gpu is None:
+        print_status("CUDA not available", "warning")
+        return False
+    device_name, vram = gpu
+    print_status(f"CUDA: {device_name} ({vram:.1f}GB VRAM)", "success")
+    if vram < 10:
+        print_status(f"Warning: 10GB+ VRAM recommended for WAN 2.2 Q4_K_M", "warning")
+
+    # Largest Qwen GGUF that runs fully on the GPU, with ~15% headroom
+    fitting = [
+        (MODELS[path]["size_gb"], variant) for variant, path in QWEN_GGUF_MODELS.items()
+        if MODELS[path]["size_gb"] * 1.15 < vram
+    ]
+    if fitting:
+        print_status(f"Qwen Image Edit GGUF for this GPU: --gguf {max(fitting)[1]}", "info")
+    else:
+        print_status("Qwen Image Edit will offload on this GPU; --gguf q2_k offloads least", "warning")
+    return True
 
 
-def clone_or_update_repo(url: str, target: Path, name: str):
-    """Clone a git repo or update if exists."""
+def clone_or_update_repo(url: str, target: Path, name: str, stream: bool = False, shallow: bool = True):
+    """
+    Clone a git repo or update if exists.
+
+    Shallow clones fetch only the latest commit, and are updated the same
+    way so they stay shallow (git pull would deepen them). The update uses
+    reset --keep, which refuses rather than discards conflicting local edits.
+    Submodules, if any, are fetched GIT_JOBS at a time. A checkout already
+    at the remote's HEAD is left alone after one ls-remote round trip.
+    """
+    jobs = f"--jobs={GIT_JOBS}"
+    git = ["git", "-c", f"submodule.fetchJobs={GIT_JOBS}"]
     if target.exists():
         print_status(f"{name} already exists, updating...", "progress")
-        run_command(["git", "pull"], cwd=target)
+        repo_git = [*git, "-C", str(target)]
+        local = run_command([*repo_git, "rev-parse", "HEAD"], check=False)
+        remote = run_command([*repo_git, "ls-remote", "origin", "HEAD"], check=False)
+        if (local.returncode == 0 and remote.returncode == 0 and
+                remote.stdout.split()[:1] == [local.stdout.strip()]):
+            print_status(f"{name} is up to date", "success")
+            return
+        is_shallow = (target / ".git" / "shallow").exists()
+        if is_shallow:
+            run_command([*repo_git, "fetch", "--depth=1", "origin", "HEAD"], stream=stream)
+            run_command([*repo_git, "reset", "--keep", "FETCH_HEAD"], stream=stream)
+        else:
+            # Never create a merge commit in a checkout setup manages
+            run_command([*repo_git, "pull", "--ff-only"], stream=stream)
+        if (target / ".gitmodules").exists():
+            depth = ["--depth=1"] if is_shallow else []
+            run_command(
+                [*repo_git, "submodule", "update", "--init", "--recursive", jobs, *depth],
+                stream=stream,
+            )
         print_status(f"{name} updated", "success")
     else:
         print_status(f"Cloning {name}...", "progress")
-        run_command(["git", "clone", url, str(target)])
+        depth = ["--depth=1", "--single-branch", "--shallow-submodules"] if shallow else []
+        run_command(
+            [*git, "clone", "--recurse-submodules", jobs, *depth, url, str(target)],
+            stream=stream,
+        )
         print_status(f"{name} cloned", "success")
 
 
-def setup_comfyui(comfyui_dir: Path):
+def setup_comfyui(comfyui_dir: Path, shallow: bool = True):
     """Set up ComfyUI installation."""
     print_status("Setting up ComfyUI...", "progress")
 
-    # Clone ComfyUI
-    clone_or_update_repo(COMFYUI_REPO, comfyui_dir, "ComfyUI")
+    # Clone ComfyUI (dependencies, PyTorch included, go in install_dependencies)
+    clone_or_update_repo(COMFYUI_REPO, comfyui_dir, "ComfyUI", stream=True, shallow=shallow)
 
-    # Install requirements
-    print_status("Installing ComfyUI dependencies...", "progress")
 
-    pip_cmd = [sys.executable, "-m", "pip"]
+def setup_custom_nodes(comfyui_dir: Path, shallow: bool = True):
+    """Install required custom nodes."""
+    print_status("Setting up custom nodes...", "progress")
 
-    # Install PyTorch with CUDA
-    print_status("Installing PyTorch with CUDA support...", "progress")
-    run_command([
-        *pip_cmd, "install",
-        "torch", "torchvision", "torchaudio",
-        "--index-url", "https://download.pytorch.org/whl/cu124"
-    ])
+    custom_nodes_dir = comfyui_dir / "custom_nodes"
+    custom_nodes_dir.mkdir(exist_ok=True)
 
-    # Install ComfyUI requirements
-    requirements_file = comfyui_dir / "requirements.txt"
-    if requirements_file.exists():
-        run_command([*pip_cmd, "install", "-r", str(requirements_file)])
+    # Clones are independent network waits, so run them together; pip
+    # installs stay sequential below as they share one environment
+    with ThreadPoolExecutor(max_workers=len(CUSTOM_NODES)) as executor:
+        futures = [
+            executor.submit(clone_or_update_repo, url, custom_nodes_dir / name, name, shallow=shallow)
+            for name, url in CUSTOM_NODES.items()
+        ]
+        for future in futures:
+            future.result()
 
-    # Install additional dependencies
-    run_command([*pip_cmd, "install", "websocket-client", "requests"])
+    print_status("Custom nodes installed", "success")
 
-    print_status("ComfyUI dependencies installed", "success")
 
+def dependency_stamp(requirement_files: list[Path], packages: list[str]) -> str:
+    """
+    Hash of everything that decides what the dependency install does.
 
-def setup_custom_nodes(comfyui_dir: Path):
-    """Install required custom nodes."""
-    print_status("Setting up custom nodes...", "progress")
+    Covers the interpreter, every requirements file's contents and the
+    extra package list, so editing any of them (or updating a custom node
+    that changes its requirements) triggers a fresh install.
+    """
+    digest = hashlib.sha256(sys.executable.encode())
+    for f in requirement_files:
+        digest.update(str(f).encode())
+        digest.update(hashlib.sha256(f.read_bytes()).digest())
+    digest.update(repr([TORCH_INDEX_URL, *packages]).encode())
+    return digest.hexdigest()
 
-    custom_nodes_dir = comfyui_dir / "custom_nodes"
-    custom_nodes_dir.mkdir(exist_ok=True)
 
-    for name, url in CUSTOM_NODES.items():
-        node_dir = custom_nodes_dir / name
-        clone_or_update_repo(url, node_dir, name)
+def load_setup_state(comfyui_dir: Path) -> dict:
+    """Read comfyui_dir/.setup_state.json, or {} if missing or unreadable."""
+    try:
+        return json.loads((comfyui_dir / ".setup_state.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_setup_state(comfyui_dir: Path, state: dict):
+    """Atomically write comfyui_dir/.setup_state.json."""
+    path = comfyui_dir / ".setup_state.json"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def install_dependencies(comfyui_dir: Path):
+    """
+    Install PyTorch, then ComfyUI, custom node and skill dependencies.
+
+    PyTorch is installed first with the CUDA wheel index as the only index.
+    Merging it into the main run as an extra index doesn't work: resolvers
+    take the highest version across indexes, and PyPI's newer torch (CPU-only
+    on Windows) would win. The requirements files then resolve together in
+    one run, where the installed torch already satisfies their unpinned
+    torch entries. If that combined install fails, falls back to installing
+    each source separately (with --user) so one broken node doesn't block
+    the rest.
+
+    A run where both the PyTorch and the combined install succeed is
+    recorded in .setup_state.json; later runs with identical inputs skip the
+    resolver entirely. Delete that file to force a reinstall.
+    """
+    requirement_files = [comfyui_dir / "requirements.txt"] + [
+        comfyui_dir / "custom_nodes" / name / "requirements.txt"
+        for name in CUSTOM_NODES
+    ]
+    requirement_files = [f for f in requirement_files if f.exists()]
+    # hf_transfer: multi-connection model downloads; tqdm: download progress bars.
+    # huggingface_hub 0.23+ always resumes interrupted downloads
+    packages = [
+        "websocket-client", "requests", "huggingface_hub>=0.23", "hf_transfer", "tqdm",
+        *ADDITIONAL_PIP_PACKAGES,
+    ]
+
+    state = load_setup_state(comfyui_dir)
+    stamp = dependency_stamp(requirement_files, [*TORCH_PACKAGES, *packages])
+    if state.get("dependencies") == stamp:
+        print_status("Dependencies unchanged since last install, skipping", "success")
+        return
+
+    print_status("Installing dependencies (including PyTorch with CUDA support)...", "progress")
+
+    # Bootstrapping uv is one small wheel and pays for itself on the big resolve
+    if find_uv() is None:
+        run_command([sys.executable, "-m", "pip", "install", "--no-input", "--disable-pip-version-check", "uv"], check=False)
+
+    pip_cmd = pip_install_cmd()
+    # uv installs into the target interpreter's environment and has no --user
+    user_flag = [] if find_uv() else ["--user"]
 
-        # Install node requirements if exists
-        req_file = node_dir / "requirements.txt"
-        if req_file.exists():
-            print_status(f"Installing {name} dependencies...", "progress")
-            try:
-                run_command([sys.executable, "-m", "pip", "install", "-r", str(req_file)])
-            except subprocess.CalledProcessError:
-                print_status(f"Some {name} dependencies failed, trying with --user...", "warning")
-                run_command([sys.executable, "-m", "pip", "install", "--user", "-r", str(req_file)], check=False)
-
-    # Install additional pip packages
-    if ADDITIONAL_PIP_PACKAGES:
-        print_status("Installing additional dependencies...", "progress")
-        try:
-            run_command([sys.executable, "-m", "pip", "install", "--user"] + ADDITIONAL_PIP_PACKAGES)
-        except subprocess.CalledProcessError:
-            print_status("Some additional packages failed to install", "warning")
+    try:
+        run_command([*pip_cmd, "--index-url", TORCH_INDEX_URL, *TORCH_PACKAGES], stream=True)
+        torch_ok = True
+    except subprocess.CalledProcessError:
+        torch_ok = False
+        print_status("PyTorch CUDA install failed; requirements may pull a CPU-only build", "warning")
 
-    print_status("Custom nodes installed", "success")
+    requirement_args = [arg for f in requirement_files for arg in ("-r", str(f))]
+    try:
+        run_command([*pip_cmd, *requirement_args, *packages], stream=True)
+        # Without the CUDA build in place, leave the next run to retry it
+        if torch_ok:
+            state["dependencies"] = stamp
+            save_setup_state(comfyui_dir, state)
+    except subprocess.CalledProcessError:
+        print_status("Combined install failed, installing each source separately...", "warning")
+        for f in requirement_files:
+            run_command([*pip_cmd, *user_flag, "-r", str(f)], check=False, stream=True)
+        run_command([*pip_cmd, *user_flag, *packages], check=False, stream=True)
+
+    load_hf_hub()
+    print_status("Dependencies installed", "success")
+
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
 
+# Set to abandon in-flight downloads at their next chunk, e.g. when setup
+# fails or is interrupted while models download in the background
+_STOP_DOWNLOADS = threading.Event()
 
-def download_file(url: str, target: Path, desc: str = None):
-    """Download a file with progress indication."""
-    target.parent.mkdir(parents=True, exist_ok=True)
 
+def check_download_stop():
+    """Raise InterruptedError once downloads have been told to stop."""
+    if _STOP_DOWNLOADS.is_set():
+        raise InterruptedError("Download cancelled")
+
+
+def get_session():
+    """
+    Return the shared requests session, creating it on first use.
+
+    One pooled session keeps TLS connections to the HF CDN alive across
+    pieces, files and retries. requests may only appear partway through a
+    full setup, so a missing install is retried on each call.
+
+    Returns:
+        requests.Session, or None if requests is not installed
+    """
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            try:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+            except ImportError:
+                return None
+
+            adapter = HTTPAdapter(
+                pool_connections=16,
+                pool_maxsize=DOWNLOAD_CONNECTIONS * MAX_PARALLEL_DOWNLOADS,
+                max_retries=Retry(
+                    total=8,
+                    backoff_factor=1.5,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=["GET", "HEAD"],
+                    respect_retry_after_header=True,
+                ),
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SESSION = session
+    return _SESSION
+
+
+@contextmanager
+def open_url(url: str, headers: dict = None, timeout: float = 60):
+    """
+    Stream a GET request through the shared session, or urllib without requests.
+
+    Args:
+        url: URL to fetch (redirects are followed)
+        headers: Extra request headers
+        timeout: Read timeout in seconds
+
+    Yields:
+        (status code, response headers, final URL, iterator of body chunks)
+    """
+    session = get_session()
+    if session is not None:
+        with session.get(url, headers=headers, stream=True, timeout=(10, timeout)) as response:
+            response.raise_for_status()
+            yield (
+                response.status_code,
+                response.headers,
+                response.url,
+                response.iter_content(DOWNLOAD_CHUNK_SIZE),
+            )
+    else:
+        request = urllib.request.Request(url, headers=headers or {})
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            yield (
+                response.status,
+                response.headers,
+                response.geturl(),
+                iter(lambda: response.read(DOWNLOAD_CHUNK_SIZE), b""),
+            )
+
+
+def probe_range_support(url: str) -> tuple[str, int] | None:
+    """
+    Check whether a server honours byte ranges for a URL.
+
+    Requests the first byte only; a 206 reply with a Content-Range total
+    confirms ranged downloads work and gives the file size.
+
+    Args:
+        url: File URL (redirects are followed)
+
+    Returns:
+        (final URL after redirects, total size in bytes), or None if the
+        server does not support ranges
+
+    Raises:
+        OSError: If the URL is unreachable or returns an HTTP error
+    """
+    with open_url(url, headers={"Range": "bytes=0-0"}, timeout=30) as (status, headers, final_url, _):
+        if status != 206:
+            return None
+        content_range = headers.get("Content-Range", "")
+
+    total = content_range.rpartition("/")[2]
+    if not total.isdigit():
+        return None
+    return final_url, int(total)
+
+
+def preallocate(f, size: int):
+    """
+    Size an open file to its final length up front.
+
+    On Linux posix_fallocate reserves real extents in one go, so the
+    filesystem lays the file out contiguously and a full disk fails here
+    rather than gigabytes in. Elsewhere truncate() sets the length, which
+    Windows backs with an allocation via SetEndOfFile.
+    """
+    f.truncate(size)
+    if hasattr(os, "posix_fallocate") and size > 0:
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except OSError as e:
+            # Unsupported on some filesystems; ENOSPC is a real error
+            if e.errno == errno.ENOSPC:
+                raise
+
+
+def drop_page_cache(fd: int, offset: int, length: int):
+    """
+    Tell the kernel a written file range won't be read again soon.
+
+    Model files are written once and only read later by ComfyUI, so keeping
+    tens of GB of them cached would evict everything else mid-setup.
+    POSIX_FADV_DONTNEED starts writeback and drops pages once clean; pages
+    still dirty stay cached, so callers advise each range twice: once when
+    written and again once writeback has had time to finish. No-op where
+    posix_fadvise is unavailable (Windows, macOS).
+    """
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+        except OSError:
+            pass
+
+
+def download_range(url: str, target: Path, start: int, end: int):
+    """Download bytes start..end (inclusive) of url into the same offsets of target."""
+    with open_url(url, headers={"Range": f"bytes={start}-{end}"}) as (status, _, _, chunks), \
+            open(target, "r+b") as f:
+        if status != 206:
+            raise OSError(f"Server ignored range request (HTTP {status})")
+        f.seek(start)
+        written = 0
+        for chunk in chunks:
+            check_download_stop()
+            f.write(chunk)
+            written += len(chunk)
+        f.flush()
+        # Start writeback now so the pages are clean, and droppable, by the
+        # time the piece has been hashed
+        drop_page_cache(f.fileno(), start, written)
+
+    if written != end - start + 1:
+        raise OSError(f"Range {start}-{end} truncated after {written} bytes")
+
+
+@contextmanager
+def progress_bar(total: int | None, desc: str):
+    """
+    Byte progress bar for a download, with live throughput.
+
+    Uses tqdm when it is installed (huggingface_hub pulls it in) and stdout
+    is a terminal; otherwise the callback does nothing, so logs and CI
+    output stay free of carriage-return noise.
+
+    Args:
+        total: Expected size in bytes, or None if unknown
+        desc: Label shown before the bar
+
+    Yields:
+        Callable taking the number of bytes just completed
+    """
+    try:
+        from tqdm import tqdm
+    except ImportError:
+        tqdm = None
+
+    if tqdm is None or not sys.stdout.isatty():
+        yield lambda n: None
+        return
+
+    with tqdm(total=total, unit="B", unit_scale=True, unit_divisor=1024, desc=desc, leave=False) as bar:
+        yield bar.update
+
+
+def download_ranged(
+    url: str,
+    part: Path,
+    size: int,
+    connections: int = DOWNLOAD_CONNECTIONS,
+    progress: Callable[[int], None] | None = None,
+) -> str:
+    """
+    Download a file as fixed-size pieces over parallel HTTP range requests.
+
+    The part file is preallocated (sparse where the filesystem allows) and
+    each piece is written in place. Finished pieces are appended to a
+    "<part>.pieces" log, so an interrupted download resumes with only the
+    unfinished pieces; the log is removed once every piece is in.
+
+    While workers download, the main thread hashes the contiguous prefix of
+    finished pieces, reading them back while they are still in the page
+    cache, so the digest is ready when the last piece lands.
+
+    Args:
+        url: File URL that supports byte ranges
+        part: Partial output file path
+        size: Total file size in bytes
+        connections: Number of parallel range requests
+        progress: Called with the byte count of each finished piece
+            (and once up front with the bytes a resume already has)
+
+    Returns:
+        Hex SHA256 digest of the downloaded file
+    """
+    progress = progress or (lambda n: None)
+    log_path = part.with_name(part.name + ".pieces")
+    header = f"{size} {DOWNLOAD_PIECE_SIZE}"
+
+    done = set()
+    if part.exists() and log_path.exists() and part.stat().st_size == size:
+        lines = log_path.read_text().splitlines()
+        if lines and lines[0] == header:
+            done = {int(line) for line in lines[1:] if line.isdigit()}
+    if done:
+        print_status(f"Resuming {part.name[:-len('.part')]} ({len(done)} piece(s) already downloaded)", "info")
+    else:
+        with open(part, "wb") as f:
+            preallocate(f, size)
+        log_path.write_text(header + "\n")
+
+    pieces = [
+        (start, min(start + DOWNLOAD_PIECE_SIZE, size) - 1)
+        for start in range(0, size, DOWNLOAD_PIECE_SIZE)
+        if start not in done
+    ]
+    progress(size - sum(end - start + 1 for start, end in pieces))
+    log_lock = threading.Lock()
+
+    digest = hashlib.sha256()
+    hashed_to = 0
+
+    # Unbuffered, so a seek never serves stale bytes from an earlier read
+    with open(log_path, "a") as log, open(part, "rb", buffering=0) as reader:
+        def fetch_piece(start: int, end: int):
+            # The session retries failed requests, but not a connection
+            # that drops mid-body; refetch the piece for those
+            for attempt in range(PIECE_RETRIES + 1):
+                try:
+                    download_range(url, part, start, end)
+                    break
+                except InterruptedError:
+                    raise
+                except Exception:
+                    if attempt == PIECE_RETRIES:
+                        raise
+                    # Back off, but wake at once if downloads are stopped
+                    _STOP_DOWNLOADS.wait(2 ** attempt)
+                    check_download_stop()
+            with log_lock:
+                log.write(f"{start}\n")
+                log.flush()
+
+        def hash_ready_pieces():
+            nonlocal hashed_to
+            while hashed_to < size and hashed_to in done:
+                reader.seek(hashed_to)
+                remaining = min(DOWNLOAD_PIECE_SIZE, size - hashed_to)
+                while remaining:
+                    chunk = reader.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise OSError(f"{part.name} shorter than expected")
+                    digest.update(chunk)
+                    remaining -= len(chunk)
+                # Hashing was the last read of this piece
+                drop_page_cache(reader.fileno(), hashed_to, DOWNLOAD_PIECE_SIZE)
+                hashed_to += DOWNLOAD_PIECE_SIZE
+
+        with ThreadPoolExecutor(max_workers=max(1, min(connections, len(pieces)))) as executor:
+            futures = {executor.submit(fetch_piece, start, end): start for start, end in pieces}
+            try:
+                hash_ready_pieces()
+                for future in as_completed(futures):
+                    future.result()
+                    start = futures[future]
+                    done.add(start)
+                    progress(min(DOWNLOAD_PIECE_SIZE, size - start))
+                    hash_ready_pieces()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    log_path.unlink()
+    return digest.hexdigest()
+
+
+def file_sha256(path: Path) -> str:
+    """Hash a file in chunks and return its hex SHA256 digest."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download_file(url: str, target: Path, desc: str = None, sha256: str = None):
+    """
+    Download a file, splitting it across parallel connections when possible.
+
+    Data goes to "<target>.part" and is renamed into place only once it is
+    complete (and matches sha256, if given), so an interrupted download is
+    never mistaken for a finished one and resumes on the next run when the
+    server supports byte ranges.
+
+    With AIVP_MODEL_CACHE_DIR set and the digest known, the file is kept in
+    that cache under <sha256>/<name> and linked (or copied) into place, so
+    other workspaces and CI jobs sharing the cache skip the download.
+
+    Args:
+        url: File URL
+        target: Output file path (its directory must exist)
+        desc: Name shown in status messages
+        sha256: Optional expected hex digest of the file; defaults to the
+            LFS hash HuggingFace publishes for HF URLs. The digest is
+            computed as data arrives, so checking it costs no extra pass
+
+    Returns:
+        True if the file is in place
+    """
     if target.exists():
         print_status(f"Already exists: {target.name}", "success")
         return True
 
     desc = desc or target.name
-    print_status(f"Downloading {desc}...", "progress")
 
     try:
-        urllib.request.urlretrieve(url, str(target))
+        if sha256 is None:
+            sha256 = hf_lfs_sha256(url)
+
+        # Cache entries are named by verified digest, so existing ones are good
+        cached = MODEL_CACHE_DIR / sha256.lower() / target.name if MODEL_CACHE_DIR and sha256 else None
+        if cached is not None and cached.exists():
+            link_or_copy(cached, target)
+            print_status(f"Reused {target.name} from model cache", "success")
+            return True
+
+        destination = cached or target
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        part = destination.with_name(destination.name + ".part")
+
+        probe = probe_range_support(url)
+        if probe is not None:
+            final_url, size = probe
+            print_status(f"Downloading {desc} ({DOWNLOAD_CONNECTIONS} connections)...", "progress")
+            with progress_bar(size, target.name) as progress:
+                actual_sha256 = download_ranged(final_url, part, size, progress=progress)
+        else:
+            print_status(f"Downloading {desc}...", "progress")
+            digest = hashlib.sha256()
+            with open_url(url) as (_, headers, _, chunks), open(part, "wb") as f:
+                length = headers.get("Content-Length", "")
+                # With a Content-Encoding the header counts encoded bytes
+                expected_size = int(length) if length.isdigit() and "Content-Encoding" not in headers else None
+                if expected_size is not None:
+                    preallocate(f, expected_size)
+                dropped_to = 0
+                with progress_bar(expected_size, target.name) as progress:
+                    for chunk in chunks:
+                        check_download_stop()
+                        digest.update(chunk)
+                        progress(len(chunk))
+                        offset = f.tell()
+                        f.write(chunk)
+                        f.flush()
+                        drop_page_cache(f.fileno(), offset, len(chunk))
+                        # Data a piece behind has been written back by now;
+                        # advising it again actually evicts it
+                        if offset - dropped_to >= 2 * DOWNLOAD_PIECE_SIZE:
+                            drop_page_cache(f.fileno(), dropped_to, DOWNLOAD_PIECE_SIZE)
+                            dropped_to += DOWNLOAD_PIECE_SIZE
+                # Drop any preallocated tail if the body came up short
+                written = f.tell()
+                f.truncate()
+            actual_sha256 = digest.hexdigest()
+
+            # A connection dropped mid-body ends the stream without an error
+            if expected_size is not None and written != expected_size:
+                raise OSError(f"Download truncated at {written} of {expected_size} bytes")
+
+        if sha256 and actual_sha256 != sha256.lower():
+            part.unlink()
+            raise OSError("SHA256 mismatch, discarded download")
+
+        os.replace(part, destination)
+        if cached is not None:
+            link_or_copy(cached, target)
         print_status(f"Downloaded: {target.name}", "success")
         return True
     except Exception as e:
@@ -316,14 +1051,102 @@ def download_file(url: str, target: Path, desc: str = None):
         return False
 
 
+def parse_hf_url(url: str) -> tuple[str, str] | None:
+    """
+    Split a huggingface.co "resolve" URL into repo ID and file path.
+
+    Args:
+        url: e.g. https://huggingface.co/org/repo/resolve/main/dir/file.gguf
+
+    Returns:
+        (repo_id, filename), or None for other URLs
+    """
+    parsed = urllib.parse.urlparse(url)
+    if parsed.netloc != "huggingface.co":
+        return None
+    parts = urllib.parse.unquote(parsed.path).strip("/").split("/", 4)
+    if len(parts) != 5 or parts[2] != "resolve" or parts[3] != "main":
+        return None
+    return f"{parts[0]}/{parts[1]}", parts[4]
+
+
+def hf_resolve_url(repo_id: str, filename: str) -> str:
+    """Build the huggingface.co download URL for a file on a repo's main branch."""
+    return f"https://huggingface.co/{repo_id}/resolve/main/{urllib.parse.quote(filename)}"
+
+
+def hf_lfs_sha256(url: str) -> str | None:
+    """
+    Look up the SHA256 HuggingFace publishes for an LFS file.
+
+    Args:
+        url: huggingface.co resolve URL
+
+    Returns:
+        Hex digest, or None if unknown (not an HF URL, not LFS, offline,
+        or huggingface_hub missing)
+    """
+    source = parse_hf_url(url)
+    if source is None or not HF_AVAILABLE:
+        return None
+    try:
+        from huggingface_hub import HfApi
+        (path_info,) = HfApi().get_paths_info(source[0], [source[1]])
+    except Exception:
+        return None
+    return getattr(getattr(path_info, "lfs", None), "sha256", None)
+
+
+def same_filesystem(a: Path, b: Path) -> bool:
+    """Check whether two existing paths live on the same device (hard links possible)."""
+    try:
+        return os.stat(a).st_dev == os.stat(b).st_dev
+    except OSError:
+        return False
+
+
+def link_or_copy(source: Path, target: Path):
+    """Hard-link source to target, copying when links are not supported."""
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def find_sibling_model(rel_path: str) -> Path | None:
+    """
+    Look for a model in the AIVP_SIBLING_MODEL_DIRS installs.
+
+    Args:
+        rel_path: Path relative to a ComfyUI models/ directory
+
+    Returns:
+        Path to a non-empty existing copy, or None
+    """
+    for models_dir in SIBLING_MODEL_DIRS:
+        candidate = models_dir / rel_path
+        try:
+            if candidate.stat().st_size > 0:
+                return candidate
+        except OSError:
+            continue
+    return None
+
+
 def download_from_hf(repo_id: str, filename: str, target: Path, desc: str = None):
-    """Download a file from HuggingFace Hub."""
+    """
+    Download a file from HuggingFace Hub.
+
+    When the HF cache is on the same filesystem as the target, the file is
+    fetched into the shared cache and hard-linked into place, so other
+    installs and tools reuse one copy instead of downloading it again.
+    Otherwise it is downloaded next to the target and moved. The target's
+    directory must already exist.
+    """
     if not HF_AVAILABLE:
         print_status("huggingface_hub not installed. Run: pip install huggingface_hub", "error")
         return False
 
-    target.parent.mkdir(parents=True, exist_ok=True)
-
     if target.exists():
         print_status(f"Already exists: {target.name}", "success")
         return True
@@ -332,7 +1155,16 @@ def download_from_hf(repo_id: str, filename: str, target: Path, desc: str = None
     print_status(f"Downloading {desc} from HuggingFace...", "progress")
 
     try:
-        # Download to a temp location then move to target
+        HF_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        if same_filesystem(HF_CACHE_DIR, target.parent):
+            downloaded = hf_hub_download(repo_id=repo_id, filename=filename)
+            # Snapshot entries are symlinks into blobs/ on POSIX; link the blob
+            link_or_copy(Path(downloaded).resolve(), target)
+            print_status(f"Downloaded: {target.name} (linked from HF cache)", "success")
+            return True
+
+        # Download next to the target, then rename it into place (local_dir
+        # is target.parent, so this never crosses filesystems)
         downloaded = hf_hub_download(
             repo_id=repo_id,
             filename=filename,
@@ -341,15 +1173,15 @@ def download_from_hf(repo_id: str, filename: str, target: Path, desc: str = None
         # Move from subfolder to target location
         downloaded_path = Path(downloaded)
         if downloaded_path != target and downloaded_path.exists():
-            import shutil
-            shutil.move(str(downloaded_path), str(target))
-            # Clean up empty subfolder
-            subfolder = target.parent / filename.split('/')[0]
-            if subfolder.exists() and subfolder.is_dir():
+            os.replace(downloaded_path, target)
+            # Clean up the now-empty subfolders, deepest first; stop at
+            # target.parent rather than os.removedirs, which would climb
+            # on and delete empty model directories above it
+            for subfolder in Path(filename).parents[:-1]:
                 try:
-                    subfolder.rmdir()
+                    (target.parent / subfolder).rmdir()
                 except OSError:
-                    pass
+                    break
         print_status(f"Downloaded: {target.name}", "success")
         return True
     except Exception as e:
@@ -357,39 +1189,254 @@ def download_from_hf(repo_id: str, filename: str, target: Path, desc: str = None
         return False
 
 
-def download_models(comfyui_dir: Path, include_q6k: bool = False):
-    """Download required models."""
+def warm_dns(hosts: set[str]):
+    """
+    Resolve download hosts up front, concurrently.
+
+    The parallel downloaders would otherwise all hit a cold resolver at the
+    same moment; a caching resolver (systemd-resolved, Windows DNS Client)
+    answers their lookups from cache after this. Failures are ignored here
+    and surface from the download itself.
+    """
+    def resolve(host: str):
+        try:
+            socket.getaddrinfo(host, 443, socket.AF_UNSPEC, socket.SOCK_STREAM)
+        except OSError:
+            pass
+
+    with ThreadPoolExecutor(max_workers=max(1, len(hosts))) as executor:
+        list(executor.map(resolve, hosts))
+
+
+def download_model(path: str, info: dict, target: Path) -> bool:
+    """
+    Download one MODELS entry by the fastest available route.
+
+    HuggingFace files go through hf_hub_download when its hf_transfer Rust
+    backend is installed; if that fails (a broken hf_transfer wheel, an
+    unsupported platform) the file is fetched again with the ranged HTTP
+    downloader, which also serves every other URL.
+
+    Returns:
+        True if the file is in place
+    """
+    # Queued behind a download that was stopped; don't start
+    if _STOP_DOWNLOADS.is_set():
+        return False
+
+    url = model_url(info)
+    hf_source = (info["hf_repo"], info["hf_file"]) if "hf_repo" in info else parse_hf_url(url)
+
+    if hf_source is not None and HF_TRANSFER_AVAILABLE:
+        if download_from_hf(*hf_source, target, path):
+            return True
+        print_status(f"Retrying {path} over plain HTTP", "warning")
+    return download_file(url, target, path, info.get("sha256"))
+
+
+def model_url(info: dict) -> str:
+    """Download URL of a MODELS entry (hf_repo entries map to their resolve URL)."""
+    if "hf_repo" in info:
+        return hf_resolve_url(info["hf_repo"], info["hf_file"])
+    return info["url"]
+
+
+def preflight_downloads(files: dict[str, dict]) -> list[str]:
+    """
+    Probe every pending download concurrently before any starts.
+
+    A dead link or a file far smaller than expected then fails setup in
+    seconds rather than after the other downloads have run for an hour.
+
+    Args:
+        files: MODELS entries about to be downloaded, keyed by path
+
+    Returns:
+        One error message per problem file (empty if all look fine)
+    """
+    def check(item: tuple[str, dict]) -> str | None:
+        path, info = item
+        try:
+            probe = probe_range_support(model_url(info))
+        except Exception as e:
+            return f"{path}: {e}"
+        if probe is not None and probe[1] < info["size_gb"] * MIN_SIZE_FRACTION * 1024**3:
+            return f"{path}: server reports {probe[1] / 1024**3:.2f}GB, expected ~{info['size_gb']}GB"
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, len(files))) as executor:
+        return [error for error in executor.map(check, files.items()) if error]
+
+
+def dedupe_model_files(paths: list[Path]) -> int:
+    """
+    Hard-link byte-identical model files together to free disk space.
+
+    Only files of equal size on the same device are compared, so distinct
+    models cost one stat() each and are never read.
+
+    Args:
+        paths: Model files to consider
+
+    Returns:
+        Number of bytes freed
+    """
+    groups: dict[tuple[int, int], list[tuple[Path, os.stat_result]]] = {}
+    for path in paths:
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        groups.setdefault((st.st_dev, st.st_size), []).append((path, st))
+
+    freed = 0
+    for (_, size), members in groups.items():
+        canonical, canonical_st = members[0]
+        for duplicate, st in members[1:]:
+            if st.st_ino == canonical_st.st_ino:
+                continue  # Already linked
+            if not filecmp.cmp(canonical, duplicate, shallow=False):
+                continue
+            temp = duplicate.with_name(duplicate.name + ".link")
+            try:
+                os.link(canonical, temp)
+                os.replace(temp, duplicate)
+            except OSError:
+                temp.unlink(missing_ok=True)
+                continue
+            print_status(f"Linked duplicate {duplicate.name} -> {canonical.name}", "info")
+            freed += size
+    return freed
+
+
+def download_models(comfyui_dir: Path, include_q6k: bool = False, gguf: str = DEFAULT_QWEN_GGUF):
+    """Download required models, with the given Qwen Image Edit GGUF variant."""
     print_status("Downloading models (this may take a while)...", "progress")
 
     models_dir = comfyui_dir / "models"
 
-    # Calculate total size
-    total_size = sum(m["size_gb"] for m in MODELS.values() if m.get("required"))
-    if include_q6k:
-        total_size += sum(m["size_gb"] for m in MODELS.values() if m.get("q6k"))
+    required = required_models(gguf)
+    selected = {**required, **Q6K_MODELS} if include_q6k else required
+    total_size = sum(info["size_gb"] for info in selected.values())
     print_status(f"Total download size: ~{total_size:.1f}GB", "info")
 
-    for path, info in MODELS.items():
-        should_download = info.get("required", False)
-        if include_q6k and info.get("q6k", False):
-            should_download = True
-        
-        if should_download:
+    warm_dns({
+        urllib.parse.urlparse(info["url"]).hostname if "url" in info else "huggingface.co"
+        for info in selected.values()
+    })
+
+    # Create each model directory once here rather than per file in the
+    # download workers
+    for parent in {(models_dir / path).parent for path in selected}:
+        parent.mkdir(parents=True, exist_ok=True)
+
+    # A truncated leftover from an interrupted run would otherwise be taken
+    # as downloaded; the size check costs one stat per file
+    for path, info in selected.items():
+        target = models_dir / path
+        if target.exists() and not model_file_ok(target, info):
+            print_status(f"{path} is incomplete, downloading it again", "warning")
+            target.unlink()
+
+    pending = {
+        path: info for path, info in selected.items()
+        if not (models_dir / path).exists() and find_sibling_model(path) is None
+    }
+    if pending:
+        print_status(f"Checking {len(pending)} download URL(s)...", "progress")
+        errors = preflight_downloads(pending)
+        if errors:
+            for error in errors:
+                print_status(error, "error")
+            return False
+
+    # Files come from independent repos/CDN edges, so one slow file should
+    # not hold up the rest
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_DOWNLOADS) as executor:
+        futures = {}
+        for path, info in selected.items():
             target = models_dir / path
-            # Use HuggingFace Hub for hf_repo models, URL for others
-            if "hf_repo" in info:
-                if not download_from_hf(info["hf_repo"], info["hf_file"], target, path):
-                    return False
-            else:
-                if not download_file(info["url"], target, path):
-                    return False
+            if not target.exists():
+                sibling = find_sibling_model(path)
+                if sibling is not None:
+                    link_or_copy(sibling, target)
+                    print_status(f"Reused {path} from {sibling.parent}", "success")
+                    continue
+
+            futures[executor.submit(download_model, path, info, target)] = path
+
+        failed = [futures[future] for future in as_completed(futures) if not future.result()]
+
+    if failed:
+        print_status(f"{len(failed)} model(s) failed to download: {', '.join(sorted(failed))}", "error")
+        return False
+
+    freed = dedupe_model_files([models_dir / path for path in selected])
+    if freed:
+        print_status(f"Freed {freed / 1024**3:.1f}GB by linking identical models", "success")
 
     print_status("Models downloaded", "success")
     return True
 
 
-def check_setup(comfyui_dir: Path) -> dict:
-    """Check if setup is complete."""
+# size_gb values are rounded, so only files far below them count as truncated
+MIN_SIZE_FRACTION = 0.5
+
+
+def list_dir(directory: Path) -> dict[str, os.DirEntry]:
+    """Entries of a directory by name from one readdir, or {} if it is missing."""
+    try:
+        with os.scandir(directory) as entries:
+            return {entry.name: entry for entry in entries}
+    except OSError:
+        return {}
+
+
+def model_file_ok(path: Path, info: dict, verify: bool = False, size: int | None = None) -> bool:
+    """
+    Check a model file locally, without touching the network.
+
+    A file passes if it matches the entry's exact "bytes" or, lacking that,
+    is at least MIN_SIZE_FRACTION of size_gb. This catches empty and
+    truncated leftovers from interrupted downloads for one stat() call.
+
+    Args:
+        path: Model file path
+        info: MODELS entry
+        verify: Also hash the file against the entry's "sha256", if any
+        size: File size if already known (skips the stat)
+
+    Returns:
+        True if the file looks complete
+    """
+    if size is None:
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return False
+
+    expected_bytes = info.get("bytes")
+    if expected_bytes is not None:
+        if size != expected_bytes:
+            return False
+    elif size < info["size_gb"] * MIN_SIZE_FRACTION * 1024**3:
+        return False
+
+    if verify and info.get("sha256"):
+        return file_sha256(path) == info["sha256"].lower()
+    return True
+
+
+def check_setup(comfyui_dir: Path, verify: bool = False, gguf: str | None = None) -> dict:
+    """
+    Check if setup is complete.
+
+    Args:
+        comfyui_dir: ComfyUI installation directory
+        verify: Hash model files that declare a sha256 (slow)
+        gguf: Qwen Image Edit GGUF variant to expect; None accepts
+            whichever is installed (Q4_K_M first)
+    """
     status = {
         "comfyui": comfyui_dir.exists(),
         "custom_nodes": {},
@@ -399,14 +1446,40 @@ def check_setup(comfyui_dir: Path) -> dict:
 
     if status["comfyui"]:
         custom_nodes_dir = comfyui_dir / "custom_nodes"
-        for name in CUSTOM_NODES:
-            status["custom_nodes"][name] = (custom_nodes_dir / name).exists()
-
-    if status["comfyui"]:
         models_dir = comfyui_dir / "models"
-        for path, info in MODELS.items():
-            if info["required"]:
-                status["models"][path] = (models_dir / path).exists()
+
+        # One readdir per directory answers every existence query in it
+        node_entries = list_dir(custom_nodes_dir)
+        status["custom_nodes"] = {name: name in node_entries for name in CUSTOM_NODES}
+
+        model_dirs = {
+            parent: list_dir(models_dir / parent)
+            for parent in {Path(path).parent for path in MODELS}
+        }
+        if gguf is None:
+            gguf = next(
+                (variant for variant, path in QWEN_GGUF_MODELS.items()
+                 if Path(path).name in model_dirs[Path(path).parent]),
+                DEFAULT_QWEN_GGUF,
+            )
+        required = required_models(gguf)
+
+        def check_model(item: tuple[str, dict]) -> bool:
+            path, info = item
+            entry = model_dirs[Path(path).parent].get(Path(path).name)
+            if entry is None:
+                return False
+            try:
+                size = entry.stat().st_size
+            except OSError:
+                return False
+            return model_file_ok(models_dir / path, info, verify, size=size)
+
+        # Size stats (and --verify hashing) still cost a round trip each
+        # on an SMB/NFS mount; issue them concurrently
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            model_checks = executor.map(check_model, required.items())
+            status["models"] = dict(zip(required, model_checks))
 
     status["ready"] = (
         status["comfyui"] and
@@ -437,7 +1510,7 @@ def print_setup_status(status: dict):
 
     print("\nModels:")
     for path, exists in status["models"].items():
-        name = Path(path).name
+        name = MODELS[path]["name"]
         if exists:
             print_status(f"  {name}", "success")
         else:
@@ -478,6 +1551,8 @@ def start_comfyui(comfyui_dir: Path, port: int = 8188):
 
 
 def main():
+    global MAX_PARALLEL_DOWNLOADS
+
     parser = argparse.ArgumentParser(
         description="Setup ComfyUI for WAN 2.2 video generation"
     )
@@ -486,6 +1561,11 @@ def main():
         action="store_true",
         help="Check setup status only"
     )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="With --check, also verify model checksums where known (reads every file)"
+    )
     parser.add_argument(
         "--start",
         action="store_true",
@@ -501,6 +1581,24 @@ def main():
         action="store_true",
         help="Include WAN 2.2 Q6_K model (12GB, higher quality, no LoRA required)"
     )
+    parser.add_argument(
+        "--gguf",
+        choices=sorted(QWEN_GGUF_MODELS),
+        default=None,
+        help=f"Qwen Image Edit GGUF variant to download (default: {DEFAULT_QWEN_GGUF}; "
+             "smaller variants fit GPUs with less VRAM)"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=MAX_PARALLEL_DOWNLOADS,
+        help=f"Model files to download at the same time (default: {MAX_PARALLEL_DOWNLOADS})"
+    )
+    parser.add_argument(
+        "--full-clone",
+        action="store_true",
+        help="Clone repositories with full git history (default: latest commit only)"
+    )
     parser.add_argument(
         "--dir",
         type=Path,
@@ -517,6 +1615,9 @@ def main():
     args = parser.parse_args()
     comfyui_dir = args.dir
 
+    # Read by download_models and when sizing the HTTP connection pool
+    MAX_PARALLEL_DOWNLOADS = max(1, args.jobs)
+
     print("\n" + "="*50)
     print("ComfyUI Setup for WAN 2.2 Video Generation")
     print(f"Install directory: {comfyui_dir}")
@@ -524,7 +1625,7 @@ def main():
 
     # Check only
     if args.check:
-        status = check_setup(comfyui_dir)
+        status = check_setup(comfyui_dir, verify=args.verify, gguf=args.gguf)
         print_setup_status(status)
         return 0 if status["ready"] else 1
 
@@ -538,7 +1639,7 @@ def main():
         if not comfyui_dir.exists():
             print_status("ComfyUI not installed. Run full setup first.", "error")
             return 1
-        download_models(comfyui_dir, include_q6k=args.q6k)
+        download_models(comfyui_dir, include_q6k=args.q6k, gguf=args.gguf or DEFAULT_QWEN_GGUF)
         return 0
 
     # Full setup
@@ -555,18 +1656,39 @@ def main():
     print()
 
     # Setup ComfyUI
-    setup_comfyui(comfyui_dir)
-
-    # Setup custom nodes
-    setup_custom_nodes(comfyui_dir)
+    setup_comfyui(comfyui_dir, shallow=not args.full_clone)
+
+    # The clone fixes where models/ lives, so the model downloads (network
+    # bound) can run alongside node setup and the pip install (mostly CPU
+    # and disk). Downloads fall back to plain HTTP until hf_transfer lands.
+    executor = ThreadPoolExecutor(max_workers=1)
+    models_future = executor.submit(
+        download_models, comfyui_dir, include_q6k=args.q6k, gguf=args.gguf or DEFAULT_QWEN_GGUF
+    )
+    try:
+        # Setup custom nodes
+        setup_custom_nodes(comfyui_dir, shallow=not args.full_clone)
+
+        # Install all Python dependencies at once
+        install_dependencies(comfyui_dir)
+
+        models_ok = models_future.result()
+    except BaseException:
+        # Rather than waiting out the downloads, stop them at their next
+        # chunk (a running hf_hub_download still finishes its file); the
+        # ranged downloads resume from their piece logs on the next run
+        _STOP_DOWNLOADS.set()
+        models_future.cancel()
+        raise
+    finally:
+        executor.shutdown(wait=False)
 
-    # Download models
-    if not download_models(comfyui_dir, include_q6k=args.q6k):
+    if not models_ok:
         print_status("Model download failed. Run again with --models", "error")
         return 1
 
     # Final status
-    status = check_setup(comfyui_dir)
+    status = check_setup(comfyui_dir, gguf=args.gguf or DEFAULT_QWEN_GGUF)
     print_setup_status(status)
 
     if status["ready"]:
@@ -4,11 +4,20 @@ Handles configuration, file I/O, and common operations.
 """
 
 import base64
+import functools
 import json
+import mimetypes
 import os
 import sys
+import time
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 
 def get_api_key() -> str:
@@ -21,70 +30,134 @@ def get_api_key() -> str:
     return key
 
 
+# Read size for streamed base64 encoding; a multiple of 3 so no chunk but
+# the last produces padding
+BASE64_CHUNK_SIZE = 3 * 64 * 1024
+
+
 def load_image_as_base64(image_path: str) -> str:
-    """Load an image file and return base64-encoded string."""
-    path = Path(image_path)
-    if not path.exists():
+    """Load an image file and return base64-encoded string.
+
+    Encodes chunk by chunk into a buffer sized up front, so the raw file is
+    never held in memory alongside its encoding.
+    """
+    st = stat_or_none(image_path)
+    if st is None:
         raise FileNotFoundError(f"Image not found: {image_path}")
 
-    with open(path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
+    encoded = bytearray(4 * ((st.st_size + 2) // 3))
+    written = 0
+    with open(image_path, "rb") as f:
+        while chunk := f.read(BASE64_CHUNK_SIZE):
+            block = base64.b64encode(chunk)
+            encoded[written:written + len(block)] = block
+            written += len(block)
+    return str(memoryview(encoded)[:written], "ascii")
+
+
+# Media types the pipeline produces, pinned so the answer doesn't depend on
+# the host's mime.types or Windows registry (older Pythons lack .webp too)
+_MIME_OVERRIDES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+    ".mp4": "video/mp4",
+    ".webm": "video/webm",
+}
 
 
 def get_mime_type(file_path: str) -> str:
     """Get MIME type based on file extension."""
-    ext = Path(file_path).suffix.lower()
-    mime_types = {
-        ".png": "image/png",
-        ".jpg": "image/jpeg",
-        ".jpeg": "image/jpeg",
-        ".webp": "image/webp",
-        ".gif": "image/gif",
-        ".mp4": "video/mp4",
-        ".webm": "video/webm",
-    }
-    return mime_types.get(ext, "application/octet-stream")
+    ext = os.path.splitext(file_path)[1].lower()
+    mime_type = _MIME_OVERRIDES.get(ext)
+    if mime_type is None:
+        mime_type = mimetypes.guess_type(file_path, strict=False)[0]
+    return mime_type or "application/octet-stream"
 
 
 def load_style_config(style_path: str) -> dict[str, Any]:
     """Load style configuration from JSON file."""
-    path = Path(style_path)
-    if not path.exists():
-        raise FileNotFoundError(f"Style config not found: {style_path}")
-
-    with open(path) as f:
-        return json.load(f)
+    try:
+        with open(style_path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Style config not found: {style_path}") from None
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # The stdlib also accepts NaN/Infinity and UTF-16/32
+    return json.loads(data)
 
 
 def save_style_config(style_config: dict[str, Any], output_path: str) -> None:
     """Save style configuration to JSON file."""
-    path = Path(output_path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-
-    with open(path, "w") as f:
-        json.dump(style_config, f, indent=2)
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    data = None
+    if ORJSON_AVAILABLE:
+        try:
+            data = orjson.dumps(style_config, option=orjson.OPT_INDENT_2)
+        except orjson.JSONEncodeError:
+            pass  # e.g. non-string keys, which the stdlib converts
+    if data is None:
+        data = json.dumps(style_config, indent=2).encode()
+    with open(output_path, "wb") as f:
+        f.write(data)
 
     print(f"Style config saved to: {output_path}")
 
 
 def ensure_output_dir(output_path: str) -> Path:
     """Ensure output directory exists and return Path object."""
-    path = Path(output_path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    return path
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    return Path(output_path)
+
+
+# Anything accepted where a filesystem path is expected
+StrPath = str | os.PathLike[str]
+
+
+def stat_or_none(path: StrPath) -> os.stat_result | None:
+    """Stat a file, returning None if it doesn't exist.
+
+    Lets callers check existence and reuse mtime/size from a single syscall.
+    """
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+# When set, only warnings and errors are printed (see set_quiet)
+_quiet = False
+
+# Progress updates are coalesced further when nobody is watching the output
+NON_TTY_PROGRESS_INTERVAL = 2.0
+
+
+def set_quiet(quiet: bool = True) -> None:
+    """Suppress info/progress/success output (for --quiet batch runs)."""
+    global _quiet
+    _quiet = quiet
+
+
+_STATUS_ICONS = {
+    "info": "[i]",
+    "success": "[+]",
+    "error": "[x]",
+    "warning": "[!]",
+    "progress": "[*]",
+}
 
 
 def print_status(message: str, status: str = "info") -> None:
     """Print formatted status message."""
-    icons = {
-        "info": "[i]",
-        "success": "[+]",
-        "error": "[x]",
-        "warning": "[!]",
-        "progress": "[*]",
-    }
-    icon = icons.get(status, "-")
-    print(f"{icon} {message}")
+    if _quiet and status not in ("error", "warning"):
+        return
+    print(f"{_STATUS_ICONS.get(status, '-')} {message}")
 
 
 def format_duration(seconds: float) -> str:
@@ -96,20 +169,70 @@ def format_duration(seconds: float) -> str:
     return f"{minutes}m {secs:.1f}s"
 
 
-def get_vram_gb() -> float | None:
+def make_progress_callback(start_ns: int, min_interval: float = 0.2) -> Callable[[str], None]:
     """
-    Get available VRAM in gigabytes.
+    Build a rate-limited progress callback for ComfyUI job updates.
+
+    ComfyUI can emit several progress messages per second; printing each one
+    makes stdout flushing dominate short generations over SSH or log pipes.
+
+    Args:
+        start_ns: Job start time from time.monotonic_ns()
+        min_interval: Minimum seconds between printed updates
 
     Returns:
-        VRAM in GB or None if unavailable
+        Callback printing "<msg> (<elapsed>)" at most once per interval
+    """
+    if _quiet:
+        return lambda msg: None
+    if not sys.stdout.isatty():
+        min_interval = max(min_interval, NON_TTY_PROGRESS_INTERVAL)
+
+    interval_ns = int(min_interval * 1e9)
+    last_print = start_ns - interval_ns
+
+    def on_progress(msg: str) -> None:
+        nonlocal last_print
+        now = time.monotonic_ns()
+        if now - last_print < interval_ns:
+            return
+        last_print = now
+        print_status(f"{msg} ({format_duration((now - start_ns) / 1e9)})", "progress")
+
+    return on_progress
+
+
+@functools.lru_cache(maxsize=1)
+def _probe_cuda() -> tuple[bool, str | None, float | None] | None:
+    """
+    Query the first CUDA device once per process.
+
+    The first query initializes the CUDA driver; the device can't change
+    while the process runs, so later callers reuse the answer.
+
+    Returns:
+        (CUDA available, device name, VRAM in GB), or None if PyTorch is
+        not installed
     """
     try:
         import torch
-        if torch.cuda.is_available():
-            return torch.cuda.get_device_properties(0).total_memory / (1024**3)
     except ImportError:
-        pass
-    return None
+        return None
+    if not torch.cuda.is_available():
+        return False, None, None
+    props = torch.cuda.get_device_properties(0)
+    return True, props.name, props.total_memory / (1024**3)
+
+
+def get_vram_gb() -> float | None:
+    """
+    Get available VRAM in gigabytes.
+
+    Returns:
+        VRAM in GB or None if unavailable
+    """
+    cuda = _probe_cuda()
+    return cuda[2] if cuda else None
 
 
 def get_recommended_resolution(vram_gb: float | None = None) -> dict:
@@ -147,20 +270,32 @@ def print_system_info() -> None:
     print(f"  Platform: {platform.system()} {platform.release()}")
 
     # CUDA/GPU info
-    try:
-        import torch
-        if torch.cuda.is_available():
-            device_name = torch.cuda.get_device_name(0)
-            vram_total = torch.cuda.get_device_properties(0).total_memory / (1024**3)
-            print(f"  GPU: {device_name}")
-            print(f"  VRAM: {vram_total:.1f} GB")
-
-            rec = get_recommended_resolution(vram_total)
-            print(f"  Recommended preset: {rec['preset']} ({rec['width']}x{rec['height']})")
-        else:
-            print("  GPU: Not available (CUDA not found)")
-    except ImportError:
+    cuda = _probe_cuda()
+    if cuda is None:
         print("  GPU: Unknown (PyTorch not installed)")
+    elif cuda[0]:
+        _, device_name, vram_total = cuda
+        print(f"  GPU: {device_name}")
+        print(f"  VRAM: {vram_total:.1f} GB")
+
+        rec = get_recommended_resolution(vram_total)
+        print(f"  Recommended preset: {rec['preset']} ({rec['width']}x{rec['height']})")
+    else:
+        print("  GPU: Not available (CUDA not found)")
+
+
+# Style config fields folded into prompts: (section, ((key, label), ...))
+_STYLE_PROMPT_FIELDS = (
+    ("visual_style", (
+        ("art_style", "Art style"),
+        ("color_palette", "Color palette"),
+        ("lighting", "Lighting"),
+    )),
+    ("motion_language", (
+        ("movement_quality", "Movement"),
+        ("camera_style", "Camera"),
+    )),
+)
 
 
 def build_enhanced_prompt(
@@ -182,23 +317,13 @@ def build_enhanced_prompt(
     parts = [base_prompt]
 
     if style_config:
-        # Add visual style
-        if "visual_style" in style_config:
-            vs = style_config["visual_style"]
-            if "art_style" in vs:
-                parts.append(f"Art style: {vs['art_style']}")
-            if "color_palette" in vs:
-                parts.append(f"Color palette: {vs['color_palette']}")
-            if "lighting" in vs:
-                parts.append(f"Lighting: {vs['lighting']}")
-
-        # Add motion language
-        if "motion_language" in style_config:
-            ml = style_config["motion_language"]
-            if "movement_quality" in ml:
-                parts.append(f"Movement: {ml['movement_quality']}")
-            if "camera_style" in ml:
-                parts.append(f"Camera: {ml['camera_style']}")
+        parts.extend(
+            f"{label}: {section[key]}"
+            for section_name, fields in _STYLE_PROMPT_FIELDS
+            if (section := style_config.get(section_name))
+            for key, label in fields
+            if key in section
+        )
 
     if additional_constraints:
         parts.extend(additional_constraints)
@@ -16,16 +16,20 @@ import shutil
 import sys
 import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Callable
 
 import cv2
 import numpy as np
 
 from comfyui_client import (
-    ComfyUIClient,
     ComfyUIError,
     WorkflowValidationError,
-    load_workflow,
+    get_client,
+    index_nodes,
+    load_workflow_bytes,
+    parse_workflow,
 )
 from utils import (
     load_style_config,
@@ -33,6 +37,10 @@ from utils import (
     print_status,
     format_duration,
     build_enhanced_prompt,
+    StrPath,
+    make_progress_callback,
+    set_quiet,
+    stat_or_none,
 )
 
 
@@ -178,138 +186,113 @@ def correct_video_colors(
     return output_path
 
 
-def update_workflow_prompts(workflow: dict, prompt: str, negative_prompt: str = None) -> dict:
-    """Update text prompts in workflow."""
-    default_negative = "blurry, low quality, distorted, deformed, static, poorly drawn, disfigured, ugly, worst quality"
+DEFAULT_NEGATIVE = "blurry, low quality, distorted, deformed, static, poorly drawn, disfigured, ugly, worst quality"
 
-    for node_id, node in workflow.items():
-        if not isinstance(node, dict):
-            continue
+RESOLUTION_CLASSES = frozenset({"ImageScale", "WanImageToVideo", "WanFirstLastFrameToVideo"})
+SAMPLER_CLASSES = frozenset({"KSampler", "KSamplerAdvanced"})
 
-        class_type = node.get("class_type", "")
-        inputs = node.get("inputs", {})
-        title = node.get("_meta", {}).get("title", "").lower()
 
-        if class_type == "CLIPTextEncode":
-            current_text = inputs.get("text", "")
-
-            if "{{PROMPT}}" in current_text or "positive" in title:
-                workflow[node_id]["inputs"]["text"] = prompt
-            elif "negative" in title:
-                workflow[node_id]["inputs"]["text"] = negative_prompt or default_negative
-
-    return workflow
-
-
-def update_workflow_images(
-    workflow: dict,
-    start_frame: str = None,
-    end_frame: str = None
-) -> dict:
-    """Update image inputs in workflow."""
-    for node_id, node in workflow.items():
-        if not isinstance(node, dict):
-            continue
-
-        class_type = node.get("class_type", "")
-        inputs = node.get("inputs", {})
-        title = node.get("_meta", {}).get("title", "").lower()
-
-        if class_type == "LoadImage":
-            current_image = str(inputs.get("image", ""))
-
-            is_start = any(x in title for x in ["first", "start"]) or "{{START_FRAME}}" in current_image
-            is_end = any(x in title for x in ["last", "end"]) or "{{END_FRAME}}" in current_image
-
-            if is_start and start_frame:
-                workflow[node_id]["inputs"]["image"] = start_frame
-            elif is_end and end_frame:
-                workflow[node_id]["inputs"]["image"] = end_frame
-            elif not is_end and start_frame:
-                workflow[node_id]["inputs"]["image"] = start_frame
+def compile_workflow_patcher(workflow: dict) -> Callable[[dict, dict], dict]:
+    """
+    Generate a patch function specialized to one workflow's layout.
 
-    return workflow
+    Node classes, titles and placeholder inputs are fixed for a given
+    workflow file, so deciding which node gets which parameter happens here
+    once. The result is straight-line code writing directly to known node
+    IDs and fields:
 
+    - CLIPTextEncode: prompt into the {{PROMPT}} or "positive" node,
+      negative_prompt (or DEFAULT_NEGATIVE) into the "negative" one
+    - LoadImage: start_frame into "first"/"start"/{{START_FRAME}} nodes and
+      untagged ones, end_frame into "last"/"end"/{{END_FRAME}} nodes
+    - Resolution nodes: width, height, length
+    - Samplers: steps, cfg, and seed when it is > 0
+    - LoraLoader: lora_strength into both strengths
 
-def update_workflow_resolution(
-    workflow: dict,
-    width: int = None,
-    height: int = None,
-    length: int = None,
-) -> dict:
-    """Update resolution parameters in workflow."""
+    Args:
+        workflow: Workflow dict the patcher is built for (not modified)
 
-    resolution_nodes = [
-        "ImageScale",
-        "WanImageToVideo",
-        "WanFirstLastFrameToVideo",
-    ]
+    Returns:
+        patch(workflow, params) -> workflow, where params holds any of
+        prompt, negative_prompt, start_frame, end_frame, width, height,
+        length, steps, cfg, seed, lora_strength. Unset values leave their
+        fields untouched; omit prompt to leave text nodes untouched.
+    """
+    lines = ["def patch(wf, p):", "    has_prompt = 'prompt' in p"]
 
-    for node_id, node in workflow.items():
-        if not isinstance(node, dict):
-            continue
+    for node_id, class_type, title, inputs in index_nodes(workflow):
+        target = f"wf[{node_id!r}]['inputs']"
 
-        class_type = node.get("class_type", "")
-        inputs = node.get("inputs", {})
+        if class_type == "CLIPTextEncode":
+            if "{{PROMPT}}" in inputs.get("text", "") or "positive" in title:
+                lines.append(f"    if has_prompt: {target}['text'] = p['prompt']")
+            elif "negative" in title:
+                lines.append(
+                    f"    if has_prompt: {target}['text'] = p.get('negative_prompt') or DEFAULT_NEGATIVE"
+                )
 
-        if class_type in resolution_nodes:
-            if width is not None and "width" in inputs:
-                workflow[node_id]["inputs"]["width"] = width
-            if height is not None and "height" in inputs:
-                workflow[node_id]["inputs"]["height"] = height
-            if length is not None and "length" in inputs:
-                workflow[node_id]["inputs"]["length"] = length
+        elif class_type == "LoadImage":
+            current_image = str(inputs.get("image", ""))
+            is_start = "first" in title or "start" in title or "{{START_FRAME}}" in current_image
+            is_end = "last" in title or "end" in title or "{{END_FRAME}}" in current_image
+            if is_start or not is_end:
+                lines.append(f"    if p.get('start_frame'): {target}['image'] = p['start_frame']")
+                if is_start and is_end:
+                    lines.append(f"    elif p.get('end_frame'): {target}['image'] = p['end_frame']")
+            else:
+                lines.append(f"    if p.get('end_frame'): {target}['image'] = p['end_frame']")
 
-    return workflow
+        elif class_type in RESOLUTION_CLASSES:
+            for field in ("width", "height", "length"):
+                if field in inputs:
+                    lines.append(f"    if p.get({field!r}) is not None: {target}[{field!r}] = p[{field!r}]")
 
+        elif class_type in SAMPLER_CLASSES:
+            for field in ("steps", "cfg"):
+                if field in inputs:
+                    lines.append(f"    if p.get({field!r}) is not None: {target}[{field!r}] = p[{field!r}]")
+            if "seed" in inputs:
+                lines.append(f"    if (p.get('seed') or 0) > 0: {target}['seed'] = p['seed']")
 
-def update_workflow_sampler(
-    workflow: dict,
-    steps: int = None,
-    cfg: float = None,
-    seed: int = None,
-) -> dict:
-    """Update sampler parameters in workflow."""
+        elif class_type == "LoraLoader":
+            lines.append(
+                f"    if p.get('lora_strength') is not None: "
+                f"{target}['strength_model'] = {target}['strength_clip'] = p['lora_strength']"
+            )
 
-    sampler_classes = ["KSampler", "KSamplerAdvanced"]
+    lines.append("    return wf")
 
-    for node_id, node in workflow.items():
-        if not isinstance(node, dict):
-            continue
+    namespace = {"DEFAULT_NEGATIVE": DEFAULT_NEGATIVE}
+    exec(compile("\n".join(lines), "<workflow-patcher>", "exec"), namespace)
+    return namespace["patch"]
 
-        class_type = node.get("class_type", "")
-        inputs = node.get("inputs", {})
 
-        if class_type in sampler_classes:
-            if steps is not None and "steps" in inputs:
-                workflow[node_id]["inputs"]["steps"] = steps
-            if cfg is not None and "cfg" in inputs:
-                workflow[node_id]["inputs"]["cfg"] = cfg
-            if seed is not None and seed > 0 and "seed" in inputs:
-                workflow[node_id]["inputs"]["seed"] = seed
+# Workflow path -> (raw bytes the patcher was built from, patcher)
+_PATCHER_CACHE: dict[str, tuple[bytes, Callable[[dict, dict], dict]]] = {}
 
-    return workflow
 
+def load_workflow_with_patcher(workflow_path: StrPath) -> tuple[dict, Callable[[dict, dict], dict]]:
+    """
+    Load a workflow along with its compiled patcher.
 
-def update_workflow_lora(
-    workflow: dict,
-    lora_strength: float = None,
-) -> dict:
-    """Update LoRA strength in workflow."""
+    The patcher is rebuilt only when the workflow file changes.
 
-    for node_id, node in workflow.items():
-        if not isinstance(node, dict):
-            continue
+    Args:
+        workflow_path: Path to workflow JSON file
 
-        class_type = node.get("class_type", "")
-        inputs = node.get("inputs", {})
+    Returns:
+        (fresh workflow dict, patch function)
+    """
+    raw = load_workflow_bytes(workflow_path)
+    workflow = parse_workflow(raw)
 
-        if class_type == "LoraLoader":
-            if lora_strength is not None:
-                workflow[node_id]["inputs"]["strength_model"] = lora_strength
-                workflow[node_id]["inputs"]["strength_clip"] = lora_strength
+    key = str(workflow_path)
+    cached = _PATCHER_CACHE.get(key)
+    if cached is None or cached[0] is not raw:
+        cached = (raw, compile_workflow_patcher(workflow))
+        _PATCHER_CACHE[key] = cached
 
-    return workflow
+    return workflow, cached[1]
 
 
 def generate_video(
@@ -358,17 +341,7 @@ def generate_video(
         Path to saved video
     """
     # Initialize client
-    client = ComfyUIClient()
-
-    if not client.is_available():
-        print_status("ComfyUI server not available!", "error")
-        print_status("Please start ComfyUI: python scripts/setup_comfyui.py --start", "error")
-        sys.exit(1)
-
-    # Free memory if requested (useful when switching from Qwen to WAN)
-    if free_memory:
-        print_status("Freeing GPU memory before generation...", "*")
-        client.free_memory()
+    client = get_client()
 
     # Apply resolution preset if specified
     if resolution_preset and resolution_preset in RESOLUTION_PRESETS:
@@ -419,11 +392,30 @@ def generate_video(
         print_status("Text-to-video without frames is not yet supported in this workflow", "error")
         sys.exit(1)
 
-    # Validate frame files exist
-    if start_frame and not Path(start_frame).exists():
+    # Read style config and workflow from disk while the server answers the
+    # availability check; the three are independent
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        style_future = pool.submit(load_style_config, style_ref) if style_ref else None
+        workflow_future = pool.submit(load_workflow_with_patcher, workflow_file)
+        server_available = client.is_available()
+
+    if not server_available:
+        print_status("ComfyUI server not available!", "error")
+        print_status("Please start ComfyUI: python scripts/setup_comfyui.py --start", "error")
+        sys.exit(1)
+
+    # Free memory if requested (useful when switching from Qwen to WAN)
+    if free_memory:
+        print_status("Freeing GPU memory before generation...", "*")
+        client.free_memory()
+
+    # Validate frame files exist (stat results are reused for upload dedup)
+    start_stat = stat_or_none(start_frame) if start_frame else None
+    end_stat = stat_or_none(end_frame) if end_frame else None
+    if start_frame and start_stat is None:
         print_status(f"Start frame not found: {start_frame}", "error")
         sys.exit(1)
-    if end_frame and not Path(end_frame).exists():
+    if end_frame and end_stat is None:
         print_status(f"End frame not found: {end_frame}", "error")
         sys.exit(1)
 
@@ -431,7 +423,7 @@ def generate_video(
     style_config = None
     if style_ref:
         try:
-            style_config = load_style_config(style_ref)
+            style_config = style_future.result()
             print_status(f"Loaded style config from: {style_ref}")
         except FileNotFoundError:
             print_status(f"Style config not found: {style_ref}", "warning")
@@ -441,13 +433,12 @@ def generate_video(
     print_status(f"Prompt: {enhanced_prompt[:100]}...")
 
     # Load workflow
-    if not workflow_file.exists():
+    try:
+        workflow, patch_workflow = workflow_future.result()
+    except FileNotFoundError:
         print_status(f"Workflow not found: {workflow_file}", "error")
         print_status("Please ensure WAN workflows are set up correctly.", "error")
         sys.exit(1)
-
-    try:
-        workflow = load_workflow(str(workflow_file))
     except json.JSONDecodeError as e:
         print_status(f"Invalid workflow JSON: {e}", "error")
         sys.exit(1)
@@ -460,7 +451,7 @@ def generate_video(
 
     if start_frame:
         try:
-            result = client.upload_image(start_frame)
+            result = client.upload_image_cached(start_frame, st=start_stat)
             start_frame_name = result["name"]
             print_status(f"Uploaded start frame: {start_frame_name}")
         except Exception as e:
@@ -469,22 +460,26 @@ def generate_video(
 
     if end_frame:
         try:
-            result = client.upload_image(end_frame)
+            result = client.upload_image_cached(end_frame, st=end_stat)
             end_frame_name = result["name"]
             print_status(f"Uploaded end frame: {end_frame_name}")
         except Exception as e:
             print_status(f"Failed to upload end frame: {e}", "error")
             sys.exit(1)
 
-    # Update workflow
-    workflow = update_workflow_prompts(workflow, enhanced_prompt)
-    workflow = update_workflow_images(workflow, start_frame_name, end_frame_name)
-    workflow = update_workflow_resolution(workflow, width, height, length)
-    workflow = update_workflow_sampler(workflow, steps, cfg, seed)
-    
-    # Skip LoRA update for Q6K/MoE modes (no LoRA in workflow or already in workflow)
-    if not use_q6k and not use_moe and not use_moe_fast:
-        workflow = update_workflow_lora(workflow, lora_strength)
+    # Update workflow (skip LoRA update for Q6K/MoE modes: no LoRA in workflow or already in workflow)
+    workflow = patch_workflow(workflow, {
+        "prompt": enhanced_prompt,
+        "start_frame": start_frame_name,
+        "end_frame": end_frame_name,
+        "width": width,
+        "height": height,
+        "length": length,
+        "steps": steps,
+        "cfg": cfg,
+        "seed": seed,
+        "lora_strength": None if (use_q6k or use_moe or use_moe_fast) else lora_strength,
+    })
 
     # Execute workflow
     print_status("Submitting video generation request...", "progress")
@@ -499,11 +494,8 @@ def generate_video(
     if width and height:
         print_status(f"Resolution: {width}x{height}")
 
-    start_time = time.time()
-
-    def on_progress(msg):
-        elapsed = time.time() - start_time
-        print_status(f"{msg} ({format_duration(elapsed)})", "progress")
+    start_ns = time.monotonic_ns()
+    on_progress = make_progress_callback(start_ns)
 
     try:
         result = client.execute_workflow(
@@ -528,7 +520,7 @@ def generate_video(
             output = ensure_output_dir(output_path)
 
             video_info = videos[0]
-            client.download_output(video_info, str(output))
+            client.download_output(video_info, output)
 
             # Apply color correction to fix WAN's color drift
             if color_correct and start_frame:
@@ -536,7 +528,7 @@ def generate_video(
                 correct_video_colors(str(output), start_frame)
                 print_status("Color correction applied", "success")
 
-            total_time = time.time() - start_time
+            total_time = (time.monotonic_ns() - start_ns) / 1e9
             print_status(f"Video saved to: {output_path} ({format_duration(total_time)})", "success")
             return str(output)
         else:
@@ -668,9 +660,17 @@ def main():
         action="store_true",
         help="Disable automatic color correction (fixes WAN's color drift issue)"
     )
+    parser.add_argument(
+        "--quiet", "-q",
+        action="store_true",
+        help="Only print warnings and errors"
+    )
 
     args = parser.parse_args()
 
+    if args.quiet:
+        set_quiet()
+
     generate_video(
         prompt=args.prompt,
         output_path=args.output,